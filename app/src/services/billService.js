@@ -80,18 +80,21 @@ export const billService = {
     }
   },
 
-  // Get settlement history
-  async getHistory(spaceId, headers = null) {
+  // Get one page of settlement history; pass the previous page's nextCursor to get the next one
+  async getHistory(spaceId, headers = null, { cursor = null, pageSize = null } = {}) {
     const authHeaders = headers || {};
+    const params = {};
+    if (cursor) params.cursor = cursor;
+    if (pageSize) params.pageSize = pageSize;
     try {
       const response = await apiClient.get(
         getApiUrl(`/api/spaces/${spaceId}/bills/history`),
-        { headers: authHeaders }
+        { headers: authHeaders, params }
       );
-      return response.data || { history: [] };
+      return response.data || { history: [], nextCursor: null };
     } catch (error) {
       if (error.response?.status === 404) {
-        return { history: [] };
+        return { history: [], nextCursor: null };
       }
       throw error;
     }
@@ -11,6 +11,7 @@ const useBillStore = create((set, get) => ({
   bills: {},
   balances: {},
   history: {},
+  historyCursor: {},
   loading: false,
   error: null,
 
@@ -199,6 +200,71 @@ const useBillStore = create((set, get) => ({
       throw error;
     }
   },
+  // Load the first page of settlement history for a space
+  loadHistory: async (spaceId, forceRefresh = false, getAuthHeaders) => {
+    const cacheKey = `history_${spaceId}`;
+    const { cache } = get();
+
+    if (!forceRefresh && cache.history[cacheKey]?.timestamp) {
+      const age = Date.now() - cache.history[cacheKey].timestamp;
+      if (age < CACHE_TTL) {
+        set((state) => ({
+          history: { ...state.history, [spaceId]: cache.history[cacheKey].data },
+          historyCursor: { ...state.historyCursor, [spaceId]: cache.history[cacheKey].nextCursor || null },
+        }));
+        return cache.history[cacheKey].data;
+      }
+    }
+
+    set({ loading: true, error: null });
+    try {
+      const headers = getAuthHeaders ? await getAuthHeaders() : {};
+      const data = await billService.getHistory(spaceId, headers);
+      const history = data.history || [];
+      const nextCursor = data.nextCursor || null;
+      const now = Date.now();
+      set((state) => ({
+        history: { ...state.history, [spaceId]: history },
+        historyCursor: { ...state.historyCursor, [spaceId]: nextCursor },
+        cache: {
+          ...state.cache,
+          history: { ...state.cache.history, [cacheKey]: { data: history, nextCursor, timestamp: now } },
+        },
+        loading: false,
+      }));
+      return history;
+    } catch (error) {
+      console.error('Failed to load history:', error);
+      set({ error: error.message, loading: false });
+      throw error;
+    }
+  },
+
+  // Append the next page of settlement history (no-op when every page is loaded)
+  loadMoreHistory: async (spaceId, getAuthHeaders) => {
+    const cursor = get().historyCursor[spaceId];
+    if (!cursor) return get().history[spaceId] || [];
+
+    try {
+      const headers = getAuthHeaders ? await getAuthHeaders() : {};
+      const data = await billService.getHistory(spaceId, headers, { cursor });
+      const nextCursor = data.nextCursor || null;
+      const cacheKey = `history_${spaceId}`;
+      const merged = [...(get().history[spaceId] || []), ...(data.history || [])];
+      set((state) => ({
+        history: { ...state.history, [spaceId]: merged },
+        historyCursor: { ...state.historyCursor, [spaceId]: nextCursor },
+        cache: {
+          ...state.cache,
+          history: { ...state.cache.history, [cacheKey]: { data: merged, nextCursor, timestamp: Date.now() } },
+        },
+      }));
+      return merged;
+    } catch (error) {
+      console.error('Failed to load more history:', error);
+      throw error;
+    }
+  },
 
   // Settle bill
   settleBill: async (spaceId, billId, settlementData, getAuthHeaders) => {
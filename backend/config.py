@@ -3,13 +3,45 @@ Application Configuration
 """
 import os
 import logging
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
+
+if TYPE_CHECKING:
+    from backend.repositories import (
+        UserRepository,
+        PasswordRepository,
+        TOTPRepository,
+        SpaceRepository,
+        NotificationRepository,
+        BillRepository,
+    )
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+_ENV_PATH = ROOT_DIR / '.env'
+_SA_DEFAULT = ROOT_DIR / 'service-account.json'
+_SA_DEFAULT_STR = str(_SA_DEFAULT) if _SA_DEFAULT.exists() else None
+
+_DOTENV_LOADED = False
+
+def _load_env_once():
+    """Load .env a single time; skipped when ALLONE_SKIP_DOTENV is set"""
+    global _DOTENV_LOADED
+    if _DOTENV_LOADED or os.environ.get('ALLONE_SKIP_DOTENV'):
+        return
+    load_dotenv(_ENV_PATH, override=False)
+    _DOTENV_LOADED = True
+
+_load_env_once()
+
+# Environment variables (read once at import)
+FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID', 'allone-90859')
+FIREBASE_SERVICE_ACCOUNT_PATH = os.environ.get('FIREBASE_SERVICE_ACCOUNT_PATH')
+JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'your_open_api_key')
+# Optional: share rate-limit state across workers (e.g. redis://localhost:6379/0)
+REDIS_URL = os.environ.get('REDIS_URL')
 
 # Configure logging
 logging.basicConfig(
@@ -19,82 +51,109 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Initialize Firebase Admin
-def initialize_firebase():
-    """Initialize Firebase Admin SDK"""
+@lru_cache(maxsize=1)
+def get_firebase_app():
+    """Initialize Firebase Admin SDK once and return the app (None on failure)"""
+    # Deferred so importing config does not load the firebase_admin package
+    import firebase_admin
+    from firebase_admin import credentials
+    
     try:
-        firebase_admin.get_app()
+        app = firebase_admin.get_app()
         logger.info("Firebase Admin already initialized")
+        return app
     except ValueError:
-        project_id = os.environ.get('FIREBASE_PROJECT_ID', 'allone-90859')
+        pass
+    
+    project_id = FIREBASE_PROJECT_ID
+    try:
+        service_account_path = FIREBASE_SERVICE_ACCOUNT_PATH
+        
+        if not service_account_path and _SA_DEFAULT_STR:
+            service_account_path = _SA_DEFAULT_STR
+            logger.info(f"Found service account at default location: {service_account_path}")
+        
+        if service_account_path and os.path.exists(service_account_path):
+            cred = credentials.Certificate(service_account_path)
+            app = firebase_admin.initialize_app(cred, {'projectId': project_id})
+            logger.info(f"✅ Firebase Admin initialized with service account: {service_account_path}")
+        else:
+            app = firebase_admin.initialize_app(options={'projectId': project_id})
+            logger.warning("⚠️  Firebase Admin initialized without service account (limited functionality)")
+        return app
+    except Exception as e:
+        logger.warning(f"Firebase Admin initialization issue: {e}. Attempting basic initialization.")
         try:
-            service_account_path = os.environ.get('FIREBASE_SERVICE_ACCOUNT_PATH')
-            
-            if not service_account_path:
-                default_path = ROOT_DIR / 'service-account.json'
-                if default_path.exists():
-                    service_account_path = str(default_path)
-                    logger.info(f"Found service account at default location: {service_account_path}")
-            
-            if service_account_path and os.path.exists(service_account_path):
-                cred = credentials.Certificate(service_account_path)
-                firebase_admin.initialize_app(cred, {'projectId': project_id})
-                logger.info(f"✅ Firebase Admin initialized with service account: {service_account_path}")
-            else:
-                firebase_admin.initialize_app(options={'projectId': project_id})
-                logger.warning("⚠️  Firebase Admin initialized without service account (limited functionality)")
-        except Exception as e:
-            logger.warning(f"Firebase Admin initialization issue: {e}. Attempting basic initialization.")
-            try:
-                firebase_admin.initialize_app(options={'projectId': project_id})
-            except Exception as e2:
-                logger.error(f"Failed to initialize Firebase Admin: {e2}")
-                pass
+            return firebase_admin.initialize_app(options={'projectId': project_id})
+        except Exception as e2:
+            logger.error(f"Failed to initialize Firebase Admin: {e2}")
+            return None
 
 # Initialize Firestore
-def initialize_firestore():
-    """Initialize Firestore client"""
+@lru_cache(maxsize=1)
+def get_db():
+    """Return the shared Firestore client, creating it on first use"""
+    from firebase_admin import firestore
+    
+    get_firebase_app()
     try:
-        db = firestore.client()
+        client = firestore.client()
         logger.info("✅ Firestore initialized successfully")
-        return db
+        return client
     except Exception as e:
         logger.warning(f"Firestore initialization failed: {e}. Some features may not work.")
         return None
 
-# Initialize Firebase and Firestore
-initialize_firebase()
-db = initialize_firestore()
-
-# Environment variables
-JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'your_open_api_key')
 # CORS origins - for web frontend
 # Note: Mobile apps don't use CORS, but we include common origins
-CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000,https://allone.co.in').split(',')
-
-# Initialize repositories (will be imported by routes)
-from backend.repositories import (
-    UserRepository,
-    PasswordRepository,
-    TOTPRepository,
-    SpaceRepository,
-    NotificationRepository,
-    BillRepository,
-)
+# Stripped and de-duplicated once (order preserved) into an immutable tuple
+CORS_ORIGINS = tuple(dict.fromkeys(
+    origin.strip()
+    for origin in os.environ.get('CORS_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000,https://allone.co.in').split(',')
+    if origin.strip()
+))
+
+# Repositories are built lazily on first access and reused afterwards
+_REPOSITORIES = {
+    'user_repo': 'UserRepository',
+    'password_repo': 'PasswordRepository',
+    'totp_repo': 'TOTPRepository',
+    'space_repo': 'SpaceRepository',
+    'notification_repo': 'NotificationRepository',
+    'bill_repo': 'BillRepository',
+}
+
+@lru_cache(maxsize=None)
+def _get_repo(name: str):
+    """Create the named repository once, or None if db is unavailable"""
+    db = get_db()
+    if not db:
+        return None
+    import backend.repositories as repositories
+    return getattr(repositories, _REPOSITORIES[name])(db)
+
+def get_user_repo() -> Optional['UserRepository']:
+    return _get_repo('user_repo')
+
+def get_password_repo() -> Optional['PasswordRepository']:
+    return _get_repo('password_repo')
+
+def get_totp_repo() -> Optional['TOTPRepository']:
+    return _get_repo('totp_repo')
+
+def get_space_repo() -> Optional['SpaceRepository']:
+    return _get_repo('space_repo')
+
+def get_notification_repo() -> Optional['NotificationRepository']:
+    return _get_repo('notification_repo')
 
-# Initialize repositories if db is available
-if db:
-    user_repo = UserRepository(db)
-    password_repo = PasswordRepository(db)
-    totp_repo = TOTPRepository(db)
-    space_repo = SpaceRepository(db)
-    notification_repo = NotificationRepository(db)
-    bill_repo = BillRepository(db)
-else:
-    user_repo = None
-    password_repo = None
-    totp_repo = None
-    space_repo = None
-    notification_repo = None
-    bill_repo = None
+def get_bill_repo() -> Optional['BillRepository']:
+    return _get_repo('bill_repo')
 
+def __getattr__(name: str):
+    """Resolve `db` and `<name>_repo` module attributes lazily (PEP 562)"""
+    if name == 'db':
+        return get_db()
+    if name in _REPOSITORIES:
+        return _get_repo(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,7 @@
 """
 Application Constants
 """
+from typing import Final
 
 # Firestore Collection Names
 COLLECTIONS = {
@@ -28,6 +29,9 @@ QUERY_LIMITS = {
     'TOTP': 500,
     'SEARCH_RESULTS': 100,
     'USER_SEARCH': 20,
+    'IN_FILTER': 30,  # Max values per Firestore 'in' filter
+    'PARALLEL_QUERIES': 10,
+    'BATCH_WRITE': 500,  # Max writes per Firestore batch commit
 }
 
 # Space Types
@@ -46,17 +50,30 @@ NOTIFICATION_TYPES = {
 }
 
 # Error Messages
+ERR_DATABASE_UNAVAILABLE: Final = 'Database not available'
+ERR_USER_NOT_FOUND: Final = 'User not found'
+ERR_PASSWORD_NOT_FOUND: Final = 'Password not found'
+ERR_TOTP_NOT_FOUND: Final = 'TOTP not found'
+ERR_SPACE_NOT_FOUND: Final = 'Space not found'
+ERR_BILL_NOT_FOUND: Final = 'Bill not found'
+ERR_NOT_AUTHORIZED: Final = 'Not authorized'
+ERR_ONLY_OWNER_CAN_MANAGE: Final = 'Only space owner can manage members'
+ERR_USER_ALREADY_MEMBER: Final = 'User is already a member'
+ERR_INVALID_SPLIT_AMOUNT: Final = 'Split amounts do not match bill total'
+ERR_PARTICIPANT_NOT_FOUND: Final = 'Participant not found in bill'
+ERR_BILL_NOT_IN_SPACE: Final = 'Bill does not belong to this space'
+
 ERROR_MESSAGES = {
-    'DATABASE_UNAVAILABLE': 'Database not available',
-    'USER_NOT_FOUND': 'User not found',
-    'PASSWORD_NOT_FOUND': 'Password not found',
-    'TOTP_NOT_FOUND': 'TOTP not found',
-    'SPACE_NOT_FOUND': 'Space not found',
-    'BILL_NOT_FOUND': 'Bill not found',
-    'NOT_AUTHORIZED': 'Not authorized',
-    'ONLY_OWNER_CAN_MANAGE': 'Only space owner can manage members',
-    'USER_ALREADY_MEMBER': 'User is already a member',
-    'INVALID_SPLIT_AMOUNT': 'Split amounts do not match bill total',
-    'PARTICIPANT_NOT_FOUND': 'Participant not found in bill',
+    'DATABASE_UNAVAILABLE': ERR_DATABASE_UNAVAILABLE,
+    'USER_NOT_FOUND': ERR_USER_NOT_FOUND,
+    'PASSWORD_NOT_FOUND': ERR_PASSWORD_NOT_FOUND,
+    'TOTP_NOT_FOUND': ERR_TOTP_NOT_FOUND,
+    'SPACE_NOT_FOUND': ERR_SPACE_NOT_FOUND,
+    'BILL_NOT_FOUND': ERR_BILL_NOT_FOUND,
+    'NOT_AUTHORIZED': ERR_NOT_AUTHORIZED,
+    'ONLY_OWNER_CAN_MANAGE': ERR_ONLY_OWNER_CAN_MANAGE,
+    'USER_ALREADY_MEMBER': ERR_USER_ALREADY_MEMBER,
+    'INVALID_SPLIT_AMOUNT': ERR_INVALID_SPLIT_AMOUNT,
+    'PARTICIPANT_NOT_FOUND': ERR_PARTICIPANT_NOT_FOUND,
+    'BILL_NOT_IN_SPACE': ERR_BILL_NOT_IN_SPACE,
 }
-
@@ -1,31 +1,104 @@
 """
 Bill Controller - Business logic for bill management
 """
+import math
 import uuid
 import logging
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from fastapi import HTTPException
-from backend.models import Bill, BillCreate, SettlementRequest
-from backend.config import bill_repo, space_repo
-from backend.constants import ERROR_MESSAGES
+from backend.models import Bill, BillCreate, BillSplitType, SettlementRequest
+from backend.config import get_bill_repo, get_space_repo
+from backend.constants import (
+    ERR_BILL_NOT_FOUND,
+    ERR_BILL_NOT_IN_SPACE,
+    ERR_DATABASE_UNAVAILABLE,
+    ERR_NOT_AUTHORIZED,
+    ERR_SPACE_NOT_FOUND,
+)
+
+if TYPE_CHECKING:
+    # Type hints only: importing repositories at runtime would load firebase_admin with backend.main
+    from backend.repositories import BillRepository, SpaceRepository
 
 logger = logging.getLogger(__name__)
 
+_UTC = timezone.utc
+
+
+def _now_iso() -> str:
+    """Current UTC time as an ISO-8601 string (the format stored on bill documents)"""
+    return datetime.now(_UTC).isoformat()
+
 
 class BillController:
+    @staticmethod
+    def _get_repos() -> Tuple['BillRepository', 'SpaceRepository']:
+        """Resolve bill and space repositories, raising 503 if unavailable"""
+        bill_repo = get_bill_repo()
+        space_repo = get_space_repo()
+        if not bill_repo or not space_repo:
+            logger.error("Repositories not available")
+            raise HTTPException(status_code=503, detail=ERR_DATABASE_UNAVAILABLE)
+        return bill_repo, space_repo
+
+    @staticmethod
+    def _authorize_space(space_repo: 'SpaceRepository', space_id: str, user_id: str, require_member: bool = True) -> Dict:
+        """Fetch a space (served from the space cache) and verify the user may access it"""
+        space = space_repo.get_by_id(space_id)
+        return BillController._check_space_access(space, space_id, user_id, require_member)
+
+    @staticmethod
+    def _check_space_access(space: Optional[Dict], space_id: str, user_id: str, require_member: bool = True) -> Dict:
+        """Raise 404/403 unless the space exists and the user may access it"""
+        if not space:
+            logger.warning(f"Space {space_id} not found")
+            raise HTTPException(status_code=404, detail=ERR_SPACE_NOT_FOUND)
+        
+        if require_member and user_id not in space['_member_set']:
+            logger.warning(f"User {user_id} not authorized for space {space_id}")
+            raise HTTPException(status_code=403, detail=ERR_NOT_AUTHORIZED)
+        return space
+
+    @staticmethod
+    def _load_bill_in_space(bill_repo: 'BillRepository', space_repo: 'SpaceRepository', space_id: str, bill_id: str, user_id: str, require_member: bool = True, use_cache: bool = True) -> Dict:
+        """Load and authorize a space and one of its bills, batching both reads when the space is not cached
+        
+        Write paths pass use_cache=False so the bill they build on is read fresh.
+        """
+        space = space_repo.get_cached(space_id)
+        if space is None:
+            bill, space = bill_repo.get_with_space(bill_id, space_id)
+            if space:
+                space = space_repo.cache_space(space)
+        else:
+            bill = bill_repo.get_by_id(bill_id, use_cache=use_cache)
+        
+        BillController._check_space_access(space, space_id, user_id, require_member)
+        
+        if not bill:
+            raise HTTPException(status_code=404, detail=ERR_BILL_NOT_FOUND)
+        
+        if bill.get('spaceId') != space_id:
+            raise HTTPException(status_code=400, detail=ERR_BILL_NOT_IN_SPACE)
+        return bill
+
     @staticmethod
     def validate_split_amounts(bill_data: BillCreate) -> None:
         """Validate that split amounts match bill total"""
         total = bill_data.amount
-        participant_total = sum(p.amount for p in bill_data.participants)
-        
-        if bill_data.splitType.value == "partial":
-            # Partial splits allow unassigned amount
-            if participant_total > total:
-                raise HTTPException(status_code=400, detail="Participant amounts cannot exceed bill total")
+        participants = bill_data.participants
+        
+        if bill_data.splitType is BillSplitType.PARTIAL:
+            # Partial splits allow unassigned amount; stop as soon as the total is exceeded
+            participant_total = 0.0
+            for p in participants:
+                participant_total += p.amount
+                if participant_total > total:
+                    raise HTTPException(status_code=400, detail="Participant amounts cannot exceed bill total")
         else:
             # Other split types must match exactly
+            participant_total = math.fsum([p.amount for p in participants])
             if abs(participant_total - total) > 0.01:  # Allow small floating point differences
                 raise HTTPException(
                     status_code=400, 
@@ -35,16 +108,10 @@ class BillController:
     @staticmethod
     def create_bill(space_id: str, bill_data: BillCreate, user_id: str) -> Bill:
         """Create a new bill in a space"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+        bill_repo, space_repo = BillController._get_repos()
         
         # Verify space exists and user is a member
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
-        
-        if user_id not in space.get('members', []) and user_id != space.get('ownerId'):
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
+        BillController._authorize_space(space_repo, space_id, user_id)
         
         # Validate split amounts
         try:
@@ -59,27 +126,12 @@ class BillController:
         if bill_data.spaceId != space_id:
             raise HTTPException(status_code=400, detail="Space ID mismatch")
         
-        bill_id = f"bill_{uuid.uuid4()}"
-        now = datetime.now(timezone.utc).isoformat()
+        bill_id = 'bill_' + uuid.uuid4().hex
+        now = _now_iso()
         
         try:
-            # Convert Pydantic model to dict
-            bill_dict = bill_data.model_dump()
-            
-            # Convert participants from Pydantic models to dicts
-            if 'participants' in bill_dict and bill_dict['participants']:
-                bill_dict['participants'] = [
-                    p.model_dump() if hasattr(p, 'model_dump') else p
-                    for p in bill_dict['participants']
-                ]
-            
-            # Convert splitType enum to string
-            if 'splitType' in bill_dict:
-                split_type = bill_dict['splitType']
-                if hasattr(split_type, 'value'):
-                    bill_dict['splitType'] = split_type.value
-                elif not isinstance(split_type, str):
-                    bill_dict['splitType'] = str(split_type)
+            # JSON mode dumps nested participants to dicts and splitType to its string value
+            bill_dict = bill_data.model_dump(mode='json')
             
             doc = {
                 "billId": bill_id,
@@ -94,7 +146,7 @@ class BillController:
             logger.info(f"Creating bill with data: {doc}")
             created = bill_repo.create(doc)
             logger.info(f"Bill created successfully: {bill_id}")
-            return Bill(**created)
+            return Bill.from_trusted(created)
         except HTTPException:
             raise
         except Exception as e:
@@ -105,20 +157,14 @@ class BillController:
     @staticmethod
     def get_bills(space_id: str, user_id: str) -> List[Bill]:
         """Get all bills for a space"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+        bill_repo, space_repo = BillController._get_repos()
         
         # Verify space exists and user is a member
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
-        
-        if user_id not in space.get('members', []) and user_id != space.get('ownerId'):
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
+        BillController._authorize_space(space_repo, space_id, user_id)
         
         try:
             bills = bill_repo.get_by_space_id(space_id)
-            return [Bill(**bill) for bill in bills]
+            return [Bill.from_trusted(bill) for bill in bills]
         except Exception as e:
             logger.error(f"Error fetching bills: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Failed to fetch bills: {str(e)}")
@@ -126,26 +172,20 @@ class BillController:
     @staticmethod
     def get_bill(space_id: str, bill_id: str, user_id: str) -> Bill:
         """Get a single bill"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+        bill_repo, space_repo = BillController._get_repos()
         
         # Verify space exists and user is a member
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
-        
-        if user_id not in space.get('members', []) and user_id != space.get('ownerId'):
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
+        BillController._authorize_space(space_repo, space_id, user_id)
         
         try:
             bill = bill_repo.get_by_id(bill_id)
             if not bill:
-                raise HTTPException(status_code=404, detail=ERROR_MESSAGES['BILL_NOT_FOUND'])
+                raise HTTPException(status_code=404, detail=ERR_BILL_NOT_FOUND)
             
             if bill.get('spaceId') != space_id:
-                raise HTTPException(status_code=400, detail="Bill does not belong to this space")
+                raise HTTPException(status_code=400, detail=ERR_BILL_NOT_IN_SPACE)
             
-            return Bill(**bill)
+            return Bill.from_trusted(bill)
         except HTTPException:
             raise
         except Exception as e:
@@ -155,38 +195,28 @@ class BillController:
     @staticmethod
     def update_bill(space_id: str, bill_id: str, bill_data: BillCreate, user_id: str) -> Bill:
         """Update a bill"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
-        # Verify space exists
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
+        bill_repo, space_repo = BillController._get_repos()
         
-        # Verify bill exists and belongs to space
-        existing = bill_repo.get_by_id(bill_id)
-        if not existing:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['BILL_NOT_FOUND'])
-        
-        if existing.get('spaceId') != space_id:
-            raise HTTPException(status_code=400, detail="Bill does not belong to this space")
+        # Verify space and bill exist and the bill belongs to the space
+        existing = BillController._load_bill_in_space(bill_repo, space_repo, space_id, bill_id, user_id, require_member=False, use_cache=False)
         
         # Only creator can update
         if existing.get('createdBy') != user_id:
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
+            raise HTTPException(status_code=403, detail=ERR_NOT_AUTHORIZED)
         
         # Validate split amounts
         BillController.validate_split_amounts(bill_data)
         
         update_doc = {
-            **bill_data.model_dump(),
-            "updatedAt": datetime.now(timezone.utc).isoformat()
+            **bill_data.model_dump(mode='json'),
+            "updatedAt": _now_iso()
         }
         
         try:
-            bill_repo.update(bill_id, update_doc)
-            updated = bill_repo.get_by_id(bill_id)
-            return Bill(**updated)
+            bill_repo.update(bill_id, update_doc, space_id=space_id)
+            # Merge locally instead of re-reading the document we just wrote
+            updated = {**existing, **update_doc, 'billId': bill_id}
+            return Bill.from_trusted(updated)
         except Exception as e:
             logger.error(f"Error updating bill: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Failed to update bill: {str(e)}")
@@ -194,28 +224,17 @@ class BillController:
     @staticmethod
     def delete_bill(space_id: str, bill_id: str, user_id: str) -> Dict:
         """Delete a bill"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
-        # Verify space exists
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
-        
-        # Verify bill exists
-        existing = bill_repo.get_by_id(bill_id)
-        if not existing:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['BILL_NOT_FOUND'])
+        bill_repo, space_repo = BillController._get_repos()
         
-        if existing.get('spaceId') != space_id:
-            raise HTTPException(status_code=400, detail="Bill does not belong to this space")
+        # Verify space and bill exist and the bill belongs to the space
+        existing = BillController._load_bill_in_space(bill_repo, space_repo, space_id, bill_id, user_id, require_member=False, use_cache=False)
         
         # Only creator can delete
         if existing.get('createdBy') != user_id:
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
+            raise HTTPException(status_code=403, detail=ERR_NOT_AUTHORIZED)
         
         try:
-            bill_repo.delete(bill_id)
+            bill_repo.delete(bill_id, space_id=space_id)
             return {"message": "Bill deleted successfully"}
         except Exception as e:
             logger.error(f"Error deleting bill: {e}", exc_info=True)
@@ -224,42 +243,26 @@ class BillController:
     @staticmethod
     def settle_bill(space_id: str, bill_id: str, settlement: SettlementRequest, user_id: str) -> Dict:
         """Mark a participant as paid"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+        bill_repo, space_repo = BillController._get_repos()
         
-        # Verify space exists
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
-        
-        # Verify bill exists
-        bill = bill_repo.get_by_id(bill_id)
-        if not bill:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['BILL_NOT_FOUND'])
-        
-        if bill.get('spaceId') != space_id:
-            raise HTTPException(status_code=400, detail="Bill does not belong to this space")
-        
-        # Verify user is a member of the space
-        if user_id not in space.get('members', []) and user_id != space.get('ownerId'):
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
-        
-        # Verify participant exists in bill
-        participants = bill.get('participants', [])
-        participant = next((p for p in participants if p.get('userId') == settlement.userId), None)
-        if not participant:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['PARTICIPANT_NOT_FOUND'])
+        # Verify user is a member; the bill itself is read once, inside the settlement transaction
+        BillController._authorize_space(space_repo, space_id, user_id)
         
         try:
-            paid_at = datetime.now(timezone.utc).isoformat()
+            paid_at = _now_iso()
             settlement_data = bill_repo.mark_participant_paid(
                 bill_id, 
                 settlement.userId, 
                 settlement.amount, 
                 paid_at,
-                settlement.notes
+                settlement.notes,
+                space_id=space_id
             )
             return {"message": "Payment recorded successfully", "settlement": settlement_data}
+        except ValueError as e:
+            # Raised for a bill in another space, a missing bill, or a user who is not a participant
+            status_code = 400 if str(e) == ERR_BILL_NOT_IN_SPACE else 404
+            raise HTTPException(status_code=status_code, detail=str(e))
         except Exception as e:
             logger.error(f"Error settling bill: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Failed to record payment: {str(e)}")
@@ -267,53 +270,36 @@ class BillController:
     @staticmethod
     def get_balances(space_id: str, user_id: str) -> Dict:
         """Get balance summary (who owes whom) for a space"""
-        logger.info(f"GET /api/spaces/{space_id}/bills/balances - Request received")
-        if not bill_repo or not space_repo:
-            logger.error("Repositories not available")
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
-        logger.info(f"User {user_id} requesting balances for space {space_id}")
+        bill_repo, space_repo = BillController._get_repos()
         
         # Verify space exists and user is a member
         try:
-            space = space_repo.get_by_id(space_id)
-            if not space:
-                logger.warning(f"Space {space_id} not found")
-                raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
+            BillController._authorize_space(space_repo, space_id, user_id)
             
-            if user_id not in space.get('members', []) and user_id != space.get('ownerId'):
-                logger.warning(f"User {user_id} not authorized for space {space_id}")
-                raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
-            
-            logger.info(f"Calculating balances for space {space_id}")
             balances_result = bill_repo.calculate_balances(space_id)
-            logger.info(f"Successfully calculated balances: {len(balances_result.get('balances', []))} entries")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Calculated %d balance entries for space %s (user %s)",
+                    len(balances_result.get('balances', [])), space_id, user_id
+                )
             return balances_result
         except HTTPException:
             raise
         except Exception as e:
             logger.error(f"Error calculating balances: {e}", exc_info=True)
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
             raise HTTPException(status_code=500, detail=f"Failed to calculate balances: {str(e)}")
 
     @staticmethod
-    def get_settlement_history(space_id: str, user_id: str) -> Dict:
-        """Get settlement history for a space"""
-        if not bill_repo or not space_repo:
-            raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def get_settlement_history(space_id: str, user_id: str, page_size: int = 50, cursor: Optional[str] = None) -> Dict:
+        """Get a page of settlement history for a space"""
+        bill_repo, space_repo = BillController._get_repos()
         
         # Verify space exists and user is a member
-        space = space_repo.get_by_id(space_id)
-        if not space:
-            raise HTTPException(status_code=404, detail=ERROR_MESSAGES['SPACE_NOT_FOUND'])
-        
-        if user_id not in space.get('members', []) and user_id != space.get('ownerId'):
-            raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
+        BillController._authorize_space(space_repo, space_id, user_id)
         
         try:
-            history = bill_repo.get_settlement_history(space_id)
-            return {"history": history}
+            history, next_cursor = bill_repo.get_settlement_history(space_id, page_size, cursor)
+            return {"history": history, "nextCursor": next_cursor}
         except Exception as e:
             logger.error(f"Error fetching settlement history: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Failed to fetch settlement history: {str(e)}")
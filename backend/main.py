@@ -3,10 +3,17 @@ Main FastAPI application entry point
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import logging
 
 from backend.config import CORS_ORIGINS, logger
-from backend.middleware.rate_limit import rate_limit_middleware
+from backend.middleware.rate_limit import (
+    RateLimitExceeded,
+    get_redis_rate_limit_script,
+    rate_limit_exceeded_handler,
+    run_rate_limit_cleanup,
+)
 from backend.routes import (
     auth_router,
     password_router,
@@ -23,7 +30,8 @@ from backend.routes import (
 app = FastAPI(
     title="AllOne Password Manager API",
     description="Secure password management API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -35,8 +43,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add rate limiting middleware
-app.middleware("http")(rate_limit_middleware)
+# Rate-limit dependencies raise this with a pre-encoded 429 body
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
 # Include routers
 # IMPORTANT: More specific routes (bill_router) must be registered BEFORE less specific ones (space_router)
@@ -56,6 +64,9 @@ async def startup_event():
     """Log startup information"""
     logger.info("🚀 AllOne API Server starting up...")
     logger.info(f"📡 CORS origins: {CORS_ORIGINS}")
+    get_redis_rate_limit_script()
+    # Keep a reference so the sweeper task is not garbage collected
+    app.state.rate_limit_cleanup_task = asyncio.create_task(run_rate_limit_cleanup())
     logger.info("✅ Server ready!")
 
 @app.get("/")
@@ -2,12 +2,14 @@
 Middleware package
 """
 from backend.middleware.auth import verify_token, verify_firebase_token
-from backend.middleware.rate_limit import check_rate_limit, rate_limit_middleware
+from backend.middleware.rate_limit import check_rate_limit, check_rate_limit_ai, rate_limit_dep, ai_rate_limit_dep
 
 __all__ = [
     'verify_token',
     'verify_firebase_token',
     'check_rate_limit',
-    'rate_limit_middleware',
+    'check_rate_limit_ai',
+    'rate_limit_dep',
+    'ai_rate_limit_dep',
 ]
 
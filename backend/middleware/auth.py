@@ -1,35 +1,85 @@
 """
 Authentication middleware
 """
-import os
 import time
 import jwt
 import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from fastapi import HTTPException, Header
-from firebase_admin import auth
+from backend.config import FIREBASE_PROJECT_ID, get_firebase_app
 
 logger = logging.getLogger(__name__)
 
+# Expected claims for the unverified fallback, computed once at import
+EXPECTED_ISS = f'https://securetoken.google.com/{FIREBASE_PROJECT_ID}'
+EXPECTED_AUD = FIREBASE_PROJECT_ID
+
+_BEARER_PREFIX = 'Bearer '
+_BEARER_PREFIX_LEN = len(_BEARER_PREFIX)
+
+# Decoded claims for recently seen tokens: {token: (claims, exp)}, LRU-bounded
+TOKEN_CACHE_MAX_SIZE = 1024
+DEFAULT_TOKEN_TTL_SECONDS = 300
+_token_cache: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+
+
+def _get_cached_claims(id_token: str) -> Optional[Dict]:
+    """Return cached claims for a token that has not expired yet"""
+    entry = _token_cache.get(id_token)
+    if entry is None:
+        return None
+    claims, exp = entry
+    if exp <= time.time():
+        del _token_cache[id_token]
+        return None
+    _token_cache.move_to_end(id_token)
+    return claims
+
+
+def _cache_claims(id_token: str, claims: Dict) -> None:
+    """Remember claims until the token's own expiry"""
+    exp = claims.get('exp') or time.time() + DEFAULT_TOKEN_TTL_SECONDS
+    _token_cache[id_token] = (claims, exp)
+    _token_cache.move_to_end(id_token)
+    if len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+        _token_cache.popitem(last=False)
+
+
 async def verify_firebase_token(id_token: str):
+    """
+    Verify Firebase ID token, reusing claims for tokens verified recently
+    """
+    cached = _get_cached_claims(id_token)
+    if cached is not None:
+        return cached
+    claims = await _verify_firebase_token_uncached(id_token)
+    if claims:
+        _cache_claims(id_token, claims)
+    return claims
+
+
+async def _verify_firebase_token_uncached(id_token: str):
     """
     Verify Firebase ID token using Admin SDK or REST API fallback
     """
     try:
-        # Try Admin SDK first
+        # Try Admin SDK first (app is initialized once, on first use)
+        from firebase_admin import auth
+        get_firebase_app()
         return auth.verify_id_token(id_token)
     except Exception as admin_error:
         logger.warning(f"Admin SDK verification failed: {admin_error}. Trying REST API fallback.")
         try:
             # Fallback: Basic token validation (DEVELOPMENT ONLY)
-            project_id = os.environ.get('FIREBASE_PROJECT_ID', 'allone-90859')
             try:
                 # Decode without verification (DEVELOPMENT ONLY - NOT SECURE FOR PRODUCTION)
                 unverified = jwt.decode(id_token, options={"verify_signature": False})
                 
                 # Basic validation
-                if unverified.get('iss') != f'https://securetoken.google.com/{project_id}':
+                if unverified.get('iss') != EXPECTED_ISS:
                     raise ValueError("Invalid token issuer")
-                if unverified.get('aud') != project_id:
+                if unverified.get('aud') != EXPECTED_AUD:
                     raise ValueError("Invalid token audience")
                 
                 # Check expiration
@@ -60,14 +110,14 @@ async def verify_token(authorization: str = Header(None)):
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    if not authorization.startswith('Bearer '):
+    if not authorization.startswith(_BEARER_PREFIX):
         raise HTTPException(
             status_code=401, 
             detail="Invalid authorization header format. Expected 'Bearer <token>'",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    token = authorization.split('Bearer ')[1].strip()
+    token = authorization[_BEARER_PREFIX_LEN:].strip()
     if not token:
         raise HTTPException(
             status_code=401, 
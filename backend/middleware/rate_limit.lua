@@ -0,0 +1,43 @@
+-- Token-bucket rate limiter, evaluated atomically inside Redis.
+--
+-- KEYS[i]        bucket hash for one window (fields: tokens, ts)
+-- ARGV[1]        current time in seconds (float)
+-- ARGV[2]        cost of this request in tokens
+-- ARGV[1 + 2i]   capacity of bucket i
+-- ARGV[2 + 2i]   refill rate of bucket i in tokens per second
+--
+-- Tokens are only taken when every bucket can pay the cost.
+-- Returns {allowed, failed_index, remaining, seconds_until_reset}; on success
+-- remaining/seconds_until_reset describe the last bucket, on failure the
+-- bucket that rejected the request (failed_index is 1-based, 0 on success).
+
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local tokens = {}
+
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[1 + 2 * i])
+  local rate = tonumber(ARGV[2 + 2 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local available = tonumber(state[1]) or capacity
+  local last = tonumber(state[2]) or now
+  available = math.min(capacity, available + math.max(0, now - last) * rate)
+  if available < cost then
+    return {0, i, math.floor(available), math.ceil((cost - available) / rate)}
+  end
+  tokens[i] = available
+end
+
+local remaining = 0
+local reset_after = 0
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[1 + 2 * i])
+  local rate = tonumber(ARGV[2 + 2 * i])
+  local left = tokens[i] - cost
+  redis.call('HSET', key, 'tokens', tostring(left), 'ts', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(capacity / rate))
+  remaining = math.floor(left)
+  reset_after = math.ceil((capacity - left) / rate)
+end
+
+return {1, 0, remaining, reset_after}
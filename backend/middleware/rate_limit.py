@@ -3,165 +3,391 @@ Rate Limiting Middleware
 Implements rate limiting for AI endpoints (20/day) and general API endpoints (100/minute)
 """
 import time
+import asyncio
 import logging
+import orjson
+from functools import partial
+from pathlib import Path
 from typing import Dict, Optional
-from fastapi import HTTPException, Request
-from collections import defaultdict
+from collections import OrderedDict, deque
+from fastapi import Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from backend.config import REDIS_URL
+from backend.middleware.auth import verify_token
 
 logger = logging.getLogger(__name__)
 
-_rate_limit_store: Dict[str, Dict] = defaultdict(dict)
+# Per-user limiter state, LRU-ordered and capped so one-off callers cannot grow it forever
+RATE_LIMIT_STORE_MAX_SIZE = 100_000
+RATE_LIMIT_CLEANUP_INTERVAL_SECONDS = 300
+_rate_limit_store: "OrderedDict[str, RateLimitInfo]" = OrderedDict()
+# Evicted entries are recycled instead of rebuilt; bounded so the pool itself stays small
+RATE_LIMIT_POOL_MAX_SIZE = 1024
+_rate_limit_pool: "list[RateLimitInfo]" = []
 
 DAILY_QUERY_LIMIT = 20
 AI_BURST_LIMIT = 5
+BURST_LIMIT = AI_BURST_LIMIT  # Backwards-compatible alias
 ROLLING_WINDOW_HOURS = 24
 BURST_WINDOW_SECONDS = 60
 
 GENERAL_API_LIMIT = 100
 GENERAL_API_WINDOW_SECONDS = 60
 
+_LUA_SCRIPT_PATH = Path(__file__).parent / 'rate_limit.lua'
+# Keep a slow or unreachable Redis from holding requests; failures fall back to the local limiter
+REDIS_SOCKET_TIMEOUT_SECONDS = 0.5
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = 30
+# After a failed Redis call, go straight to the local limiter for this long instead of timing out per request
+REDIS_RETRY_AFTER_SECONDS = 30
+
 
 class RateLimitInfo:
     """Rate limit information"""
-    def __init__(self, user_id: str):
+    __slots__ = ("user_id", "last_request", "requests", "burst_requests", "gen_prev", "gen_cur", "gen_bucket")
+    
+    def __init__(self, user_id: str, now: float):
+        self.user_id = user_id
+        self.last_request = now
+        # Timestamps in arrival order, so expired entries are always on the left
+        self.requests: deque = deque()
+        self.burst_requests: deque = deque()
+        # General limiter: approximate sliding window over two fixed buckets
+        self.gen_prev = 0
+        self.gen_cur = 0
+        self.gen_bucket = 0
+    
+    def reset(self, user_id: str, now: float) -> None:
+        """Reinitialize a pooled instance for a new user"""
         self.user_id = user_id
-        self.requests: list = []
-        self.burst_requests: list = []
-        self.general_requests: list = []
+        self.last_request = now
+        self.requests.clear()
+        self.burst_requests.clear()
+        self.gen_prev = 0
+        self.gen_cur = 0
+        self.gen_bucket = 0
     
-    def add_request(self, is_ai: bool = False):
-        """Add a new request timestamp"""
-        now = time.time()
+    def _roll_general_window(self, now: float) -> None:
+        """Advance the general limiter to the bucket containing `now`"""
+        bucket = int(now // GENERAL_API_WINDOW_SECONDS)
+        if bucket != self.gen_bucket:
+            # The previous bucket only carries weight if it is directly adjacent
+            self.gen_prev = self.gen_cur if bucket == self.gen_bucket + 1 else 0
+            self.gen_cur = 0
+            self.gen_bucket = bucket
+    
+    def add_request(self, now: float, is_ai: bool = False):
+        """Add a new request timestamp (windows are trimmed by the check_* calls)"""
+        self.last_request = now
         if is_ai:
             self.requests.append(now)
             self.burst_requests.append(now)
-            cutoff = now - (ROLLING_WINDOW_HOURS * 3600)
-            self.requests = [req for req in self.requests if req > cutoff]
-            burst_cutoff = now - BURST_WINDOW_SECONDS
-            self.burst_requests = [req for req in self.burst_requests if req > burst_cutoff]
         else:
-            self.general_requests.append(now)
-            general_cutoff = now - GENERAL_API_WINDOW_SECONDS
-            self.general_requests = [req for req in self.general_requests if req > general_cutoff]
+            self._roll_general_window(now)
+            self.gen_cur += 1
     
-    def check_daily_limit(self) -> tuple[bool, int, int]:
+    def check_daily_limit(self, now: float) -> tuple[bool, int, int]:
         """Check if daily limit is exceeded for AI"""
-        count = len(self.requests)
+        requests = self.requests
+        cutoff = now - (ROLLING_WINDOW_HOURS * 3600)
+        while requests and requests[0] <= cutoff:
+            requests.popleft()
+        count = len(requests)
         remaining = max(0, DAILY_QUERY_LIMIT - count)
         is_allowed = count < DAILY_QUERY_LIMIT
         reset_time = None
-        if self.requests:
-            oldest_request = min(self.requests)
+        if requests:
+            oldest_request = requests[0]
             reset_time = int(oldest_request + (ROLLING_WINDOW_HOURS * 3600))
         return is_allowed, remaining, reset_time
     
-    def check_burst_limit(self) -> tuple[bool, int]:
+    def check_burst_limit(self, now: float) -> tuple[bool, int]:
         """Check if burst limit is exceeded for AI"""
-        count = len(self.burst_requests)
+        burst_requests = self.burst_requests
+        cutoff = now - BURST_WINDOW_SECONDS
+        while burst_requests and burst_requests[0] <= cutoff:
+            burst_requests.popleft()
+        count = len(burst_requests)
         remaining = max(0, AI_BURST_LIMIT - count)
         is_allowed = count < AI_BURST_LIMIT
         return is_allowed, remaining
     
-    def check_general_limit(self) -> tuple[bool, int]:
+    def check_general_limit(self, now: float) -> tuple[bool, int]:
         """Check if general API limit is exceeded"""
-        count = len(self.general_requests)
+        self._roll_general_window(now)
+        # Weight the previous bucket by how much of it still overlaps the window
+        elapsed = (now % GENERAL_API_WINDOW_SECONDS) / GENERAL_API_WINDOW_SECONDS
+        count = int(self.gen_prev * (1 - elapsed) + self.gen_cur)
         remaining = max(0, GENERAL_API_LIMIT - count)
         is_allowed = count < GENERAL_API_LIMIT
         return is_allowed, remaining
 
 
-def get_rate_limit_info(user_id: str) -> RateLimitInfo:
+def _release_rate_limit_info(info: RateLimitInfo) -> None:
+    """Return an evicted entry to the pool if there is room"""
+    if len(_rate_limit_pool) < RATE_LIMIT_POOL_MAX_SIZE:
+        _rate_limit_pool.append(info)
+
+
+def get_rate_limit_info(user_id: str, now: float) -> RateLimitInfo:
     """Get or create rate limit info for user"""
-    if user_id not in _rate_limit_store:
-        _rate_limit_store[user_id] = RateLimitInfo(user_id)
-    return _rate_limit_store[user_id]
+    info = _rate_limit_store.get(user_id)
+    if info is None:
+        if _rate_limit_pool:
+            info = _rate_limit_pool.pop()
+            info.reset(user_id, now)
+        else:
+            info = RateLimitInfo(user_id, now)
+        _rate_limit_store[user_id] = info
+        if len(_rate_limit_store) > RATE_LIMIT_STORE_MAX_SIZE:
+            _release_rate_limit_info(_rate_limit_store.popitem(last=False)[1])
+    else:
+        _rate_limit_store.move_to_end(user_id)
+    return info
+
+
+def cleanup_rate_limit_store() -> int:
+    """Drop users idle for longer than the largest window, returns count removed"""
+    cutoff = time.time() - ROLLING_WINDOW_HOURS * 3600
+    idle = [user_id for user_id, info in _rate_limit_store.items() if info.last_request < cutoff]
+    for user_id in idle:
+        info = _rate_limit_store.pop(user_id, None)
+        if info is not None:
+            _release_rate_limit_info(info)
+    return len(idle)
+
+
+async def run_rate_limit_cleanup():
+    """Periodically sweep idle entries from the in-process store"""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_CLEANUP_INTERVAL_SECONDS)
+        try:
+            removed = cleanup_rate_limit_store()
+            if removed:
+                logger.debug("Removed %d idle rate limit entries", removed)
+        except Exception as e:
+            logger.warning(f"Rate limit cleanup failed: {e}")
+
+
+# Static parts of the 429 payloads; only reset_time varies per rejection
+_BURST_ERR_TEMPLATE = {
+    "error": "rate_limit_exceeded",
+    "type": "burst",
+    "message": "Too many requests. Please wait a minute before trying again.",
+    "limit": AI_BURST_LIMIT,
+    "remaining": 0,
+}
+_DAILY_ERR_TEMPLATE = {
+    "error": "rate_limit_exceeded",
+    "type": "daily",
+    "message": f"You've reached your daily limit of {DAILY_QUERY_LIMIT} queries. Please try again later.",
+    "limit": DAILY_QUERY_LIMIT,
+    "remaining": 0,
+}
+_GENERAL_ERR_TEMPLATE = {
+    "error": "rate_limit_exceeded",
+    "type": "general",
+    "message": "Too many requests. Please wait a minute before trying again.",
+    "limit": GENERAL_API_LIMIT,
+    "remaining": 0,
+}
+
+# Pre-encoded, lowercased header names appended straight onto the raw header list
+_HDR_LIMIT_B = b"x-ratelimit-limit"
+_HDR_REMAINING_B = b"x-ratelimit-remaining"
+_HDR_RESET_B = b"x-ratelimit-reset"
+
+
+# 429 bodies pre-encoded up to the trailing reset_time value: {"detail": {..., "reset_time": <n>}}
+_ERR_BODY_PREFIXES = {
+    template["type"]: b'{"detail":' + orjson.dumps(template)[:-1] + b',"reset_time":'
+    for template in (_BURST_ERR_TEMPLATE, _DAILY_ERR_TEMPLATE, _GENERAL_ERR_TEMPLATE)
+}
+
+
+class RateLimitExceeded(Exception):
+    """Raised by the rate-limit dependencies; carries the already-encoded 429 body"""
+    def __init__(self, body: bytes):
+        self.body = body
+
+
+def _encode_error_body(info: Dict) -> bytes:
+    reset_time = info.get("reset_time")
+    suffix = b"null}}" if reset_time is None else b"%d}}" % reset_time
+    return _ERR_BODY_PREFIXES[info["type"]] + suffix
+
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> Response:
+    """Send the pre-encoded 429 body without another JSON serialization pass"""
+    return Response(content=exc.body, status_code=429, media_type="application/json")
+
+
+def _burst_error(reset_time: int) -> Dict:
+    return {**_BURST_ERR_TEMPLATE, "reset_time": reset_time}
+
+
+def _daily_error(reset_time: Optional[int]) -> Dict:
+    return {**_DAILY_ERR_TEMPLATE, "reset_time": reset_time}
+
 
+def _general_error(reset_time: int) -> Dict:
+    return {**_GENERAL_ERR_TEMPLATE, "reset_time": reset_time}
 
-def check_rate_limit(user_id: str, is_ai: bool = False) -> tuple[bool, Optional[Dict]]:
-    """Check rate limits for a user"""
-    rate_info = get_rate_limit_info(user_id)
+
+_redis_script = None
+_redis_unavailable = False
+_redis_skip_until = 0.0
+
+
+def get_redis_rate_limit_script():
+    """Return the registered token-bucket script, or None when Redis is not configured"""
+    global _redis_script, _redis_unavailable
+    if _redis_script is not None or _redis_unavailable or not REDIS_URL:
+        return _redis_script
+    try:
+        import redis
+        client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        )
+        script = client.register_script(_LUA_SCRIPT_PATH.read_text())
+        # Preload so the first request can use EVALSHA directly
+        client.script_load(script.script)
+        _redis_script = script
+        logger.info("✅ Rate limiting backed by Redis")
+    except Exception as e:
+        _redis_unavailable = True
+        logger.warning(f"Redis rate limiting unavailable ({e}). Using in-process limiter.")
+    return _redis_script
+
+
+def _check_rate_limit_redis(script, user_id: str, is_ai: bool, now: float) -> tuple[bool, Optional[Dict]]:
+    """Check rate limits with the atomic Redis token-bucket script"""
+    if is_ai:
+        keys = [f"ratelimit:{user_id}:ai_burst", f"ratelimit:{user_id}:ai_daily"]
+        args = [now, 1,
+                AI_BURST_LIMIT, AI_BURST_LIMIT / BURST_WINDOW_SECONDS,
+                DAILY_QUERY_LIMIT, DAILY_QUERY_LIMIT / (ROLLING_WINDOW_HOURS * 3600)]
+    else:
+        keys = [f"ratelimit:{user_id}:general"]
+        args = [now, 1, GENERAL_API_LIMIT, GENERAL_API_LIMIT / GENERAL_API_WINDOW_SECONDS]
+    
+    allowed, failed_index, remaining, reset_after = script(keys=keys, args=args)
+    reset_time = int(now + reset_after)
+    if not allowed:
+        if not is_ai:
+            return False, _general_error(reset_time)
+        return False, _burst_error(reset_time) if failed_index == 1 else _daily_error(reset_time)
+    
+    return True, {
+        "remaining": remaining,
+        "limit": DAILY_QUERY_LIMIT if is_ai else GENERAL_API_LIMIT,
+        "reset_time": reset_time
+    }
+
+
+def _check_rate_limit_local(user_id: str, is_ai: bool, now: float) -> tuple[bool, Optional[Dict]]:
+    """Check rate limits against this process's in-memory store"""
+    rate_info = get_rate_limit_info(user_id, now)
     
     if is_ai:
-        burst_allowed, burst_remaining = rate_info.check_burst_limit()
+        burst_allowed, burst_remaining = rate_info.check_burst_limit(now)
         if not burst_allowed:
-            return False, {
-                "error": "rate_limit_exceeded",
-                "type": "burst",
-                "message": f"Too many requests. Please wait a minute before trying again.",
-                "limit": AI_BURST_LIMIT,
-                "remaining": 0,
-                "reset_time": int(time.time() + BURST_WINDOW_SECONDS)
-            }
+            return False, _burst_error(int(now) + BURST_WINDOW_SECONDS)
         
-        daily_allowed, daily_remaining, reset_time = rate_info.check_daily_limit()
+        daily_allowed, daily_remaining, reset_time = rate_info.check_daily_limit(now)
         if not daily_allowed:
-            return False, {
-                "error": "rate_limit_exceeded",
-                "type": "daily",
-                "message": f"You've reached your daily limit of {DAILY_QUERY_LIMIT} queries. Please try again later.",
-                "limit": DAILY_QUERY_LIMIT,
-                "remaining": 0,
-                "reset_time": reset_time
-            }
+            return False, _daily_error(reset_time)
         
-        rate_info.add_request(is_ai=True)
+        rate_info.add_request(now, is_ai=True)
         return True, {
             "remaining": daily_remaining - 1,
             "limit": DAILY_QUERY_LIMIT,
             "reset_time": reset_time
         }
     else:
-        general_allowed, general_remaining = rate_info.check_general_limit()
+        general_allowed, general_remaining = rate_info.check_general_limit(now)
         if not general_allowed:
-            return False, {
-                "error": "rate_limit_exceeded",
-                "type": "general",
-                "message": f"Too many requests. Please wait a minute before trying again.",
-                "limit": GENERAL_API_LIMIT,
-                "remaining": 0,
-                "reset_time": int(time.time() + GENERAL_API_WINDOW_SECONDS)
-            }
+            return False, _general_error(int(now) + GENERAL_API_WINDOW_SECONDS)
         
-        rate_info.add_request(is_ai=False)
+        rate_info.add_request(now, is_ai=False)
         return True, {
             "remaining": general_remaining - 1,
             "limit": GENERAL_API_LIMIT,
-            "reset_time": int(time.time() + GENERAL_API_WINDOW_SECONDS)
+            "reset_time": int(now) + GENERAL_API_WINDOW_SECONDS
         }
 
 
-async def rate_limit_middleware(request: Request, call_next):
-    """Rate limiting middleware for all API routes"""
-    path = request.url.path
-    
-    if not path.startswith('/api/'):
-        return await call_next(request)
-    
-    user_id = None
-    if hasattr(request.state, 'user_id'):
-        user_id = request.state.user_id
-    elif hasattr(request, 'user') and hasattr(request.user, 'uid'):
-        user_id = request.user.uid
-    
-    if not user_id:
-        return await call_next(request)
-    
-    is_ai = path.startswith('/api/ai/')
-    is_allowed, info = check_rate_limit(user_id, is_ai=is_ai)
+def _try_rate_limit_redis(user_id: str, is_ai: bool, now: float) -> Optional[tuple[bool, Optional[Dict]]]:
+    """Check rate limits in Redis, or None when Redis is not configured, backing off, or the call failed"""
+    global _redis_skip_until
+    if now < _redis_skip_until:
+        return None
+    script = get_redis_rate_limit_script()
+    if script is None:
+        return None
+    try:
+        return _check_rate_limit_redis(script, user_id, is_ai, now)
+    except Exception as e:
+        _redis_skip_until = now + REDIS_RETRY_AFTER_SECONDS
+        logger.warning(
+            "Redis rate limit check failed, using in-process limiter for %ds: %s",
+            REDIS_RETRY_AFTER_SECONDS, e
+        )
+        return None
+
+
+def check_rate_limit(user_id: str, is_ai: bool = False, now: Optional[float] = None) -> tuple[bool, Optional[Dict]]:
+    """Check rate limits for a user (shared across workers when REDIS_URL is set)"""
+    now = now or time.time()
+    result = _try_rate_limit_redis(user_id, is_ai, now)
+    if result is not None:
+        return result
+    return _check_rate_limit_local(user_id, is_ai, now)
+
+
+async def check_rate_limit_async(user_id: str, is_ai: bool = False) -> tuple[bool, Optional[Dict]]:
+    """check_rate_limit for async callers: Redis socket I/O runs in the threadpool, the local store on the loop"""
+    now = time.time()
+    # Skip the threadpool hop entirely while Redis is backing off
+    if REDIS_URL and now >= _redis_skip_until:
+        result = await run_in_threadpool(_try_rate_limit_redis, user_id, is_ai, now)
+        if result is not None:
+            return result
+    return _check_rate_limit_local(user_id, is_ai, now)
+
+
+# AI endpoints share the same store but are checked against the daily/burst limits
+check_rate_limit_ai = partial(check_rate_limit, is_ai=True)
+
+
+async def _enforce_rate_limit(token_data: Dict, request: Request, response: Response, is_ai: bool) -> None:
+    """Raise 429 when the caller is over the limit, otherwise attach X-RateLimit-* headers"""
+    user_id = token_data['uid']
+    is_allowed, info = await check_rate_limit_async(user_id, is_ai=is_ai)
     
     if not is_allowed:
-        logger.warning(f"Rate limit exceeded for user {user_id} on {path}: {info}")
-        raise HTTPException(status_code=429, detail=info)
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning("Rate limit exceeded for user %s on %s: %s", user_id, request.scope['path'], info)
+        raise RateLimitExceeded(_encode_error_body(info))
     
-    response = await call_next(request)
-    limit_key = "X-RateLimit-Limit"
-    remaining_key = "X-RateLimit-Remaining"
-    reset_key = "X-RateLimit-Reset"
-    
-    response.headers[limit_key] = str(info.get("limit", 0))
-    response.headers[remaining_key] = str(info.get("remaining", 0))
+    rows = [
+        (_HDR_LIMIT_B, str(info.get("limit", 0)).encode()),
+        (_HDR_REMAINING_B, str(info.get("remaining", 0)).encode()),
+    ]
     if info.get("reset_time"):
-        response.headers[reset_key] = str(info["reset_time"])
-    
-    return response
+        rows.append((_HDR_RESET_B, str(info["reset_time"]).encode()))
+    # FastAPI copies the dependency response's raw headers onto the final response
+    response.raw_headers.extend(rows)
+
+
+async def rate_limit_dep(request: Request, response: Response, token_data: dict = Depends(verify_token)):
+    """Dependency enforcing the general API limit on authenticated routes"""
+    await _enforce_rate_limit(token_data, request, response, is_ai=False)
+
 
+async def ai_rate_limit_dep(request: Request, response: Response, token_data: dict = Depends(verify_token)):
+    """Dependency enforcing the AI daily and burst limits"""
+    await _enforce_rate_limit(token_data, request, response, is_ai=True)
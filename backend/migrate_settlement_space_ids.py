@@ -0,0 +1,25 @@
+"""
+One-off migration: stamp spaceId onto settlements created before it was stored
+Settlement history queries by spaceId, so older settlements are hidden until this has run.
+Required deploy step: run once before starting the release that serves history by spaceId:
+    python backend/migrate_settlement_space_ids.py
+(or `docker compose --profile migrate run --rm migrate`)
+"""
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+if str(parent_dir) not in sys.path:
+    sys.path.insert(0, str(parent_dir))
+
+if __name__ == "__main__":
+    from backend.config import get_bill_repo, logger
+    
+    bill_repo = get_bill_repo()
+    if not bill_repo:
+        logger.error("Database not available; nothing migrated")
+        sys.exit(1)
+    
+    updated = bill_repo.backfill_settlement_space_ids()
+    logger.info(f"Backfilled spaceId on {updated} settlements")
@@ -0,0 +1,24 @@
+"""
+One-off migration: stamp active, email_lower and displayName_lower onto users created before they were stored
+User search filters on active == True and range-queries the *_lower fields, so run this once
+before deploying the Firestore-backed search (users missing any of them cannot be found):
+    python backend/migrate_user_search_fields.py
+"""
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+if str(parent_dir) not in sys.path:
+    sys.path.insert(0, str(parent_dir))
+
+if __name__ == "__main__":
+    from backend.config import get_user_repo, logger
+    
+    user_repo = get_user_repo()
+    if not user_repo:
+        logger.error("Database not available; nothing migrated")
+        sys.exit(1)
+    
+    updated = user_repo.backfill_search_fields()
+    logger.info(f"Backfilled search fields on {updated} users")
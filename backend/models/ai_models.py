@@ -1,17 +1,17 @@
 """
 AI-related Pydantic models
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, List, Any
 
 class AIQuery(BaseModel):
     query: str
-    context: Optional[Dict] = {}
+    context: Dict[str, Any] = Field(default_factory=dict)
 
 class AIChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
-    context: Optional[Dict] = {}
+    context: Dict[str, Any] = Field(default_factory=dict)
 
 class AIChatResponse(BaseModel):
     type: str  # "text", "tool_call", "link", "error"
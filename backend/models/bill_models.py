@@ -1,8 +1,8 @@
 """
 Bill-related Pydantic models
 """
-from pydantic import BaseModel, ConfigDict, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Dict, List, Optional, Self
 from enum import Enum
 from datetime import datetime
 
@@ -12,6 +12,14 @@ class BillSplitType(str, Enum):
     SPECIFIC_AMOUNT = "specific_amount"
     PARTIAL = "partial"
 
+# Value -> member table so stored rows skip EnumMeta.__call__
+_SPLIT_TYPES = {t.value: t for t in BillSplitType}
+
+def _coerce_split_type(v):
+    """Map a known splitType string straight to its member"""
+    # Unknown values fall through so pydantic still reports the enum error
+    return _SPLIT_TYPES.get(v, v) if isinstance(v, str) else v
+
 class BillParticipant(BaseModel):
     userId: str
     amount: float
@@ -37,8 +45,13 @@ class BillCreate(BaseModel):
     participants: List[BillParticipant]
     spaceId: str
 
+    @field_validator("splitType", mode="before")
+    @classmethod
+    def split_type_lookup(cls, v):
+        return _coerce_split_type(v)
+
 class Bill(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", frozen=True)
     billId: str
     spaceId: str
     createdBy: str
@@ -54,6 +67,21 @@ class Bill(BaseModel):
     updatedAt: str
     isSettled: bool = False
 
+    @field_validator("splitType", mode="before")
+    @classmethod
+    def split_type_lookup(cls, v):
+        return _coerce_split_type(v)
+
+    @classmethod
+    def from_trusted(cls, data: Dict) -> Self:
+        """Build from a stored document without re-running validation"""
+        # model_construct does not recurse, so build the nested parts explicitly
+        return cls.model_construct(**{
+            **data,
+            "splitType": _coerce_split_type(data["splitType"]),
+            "participants": [BillParticipant.model_construct(**p) for p in data.get("participants", [])],
+        })
+
 class SettlementRequest(BaseModel):
     userId: str
     amount: float
@@ -1,7 +1,8 @@
 """
 Notification-related Pydantic models
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from typing import Dict, Self
 
 class NotificationCreate(BaseModel):
     title: str
@@ -10,6 +11,7 @@ class NotificationCreate(BaseModel):
     read: bool = False
 
 class Notification(BaseModel):
+    model_config = ConfigDict(frozen=True)
     notificationId: str
     userId: str
     title: str
@@ -18,3 +20,7 @@ class Notification(BaseModel):
     read: bool
     createdAt: str
 
+    @classmethod
+    def from_trusted(cls, data: Dict) -> Self:
+        """Build from a stored document without re-running validation"""
+        return cls.model_construct(**data)
@@ -2,7 +2,7 @@
 Password-related Pydantic models
 """
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict, Self
 
 class PasswordCreate(BaseModel):
     spaceId: str = "personal"
@@ -17,7 +17,7 @@ class PasswordCreate(BaseModel):
     strength: Optional[int] = 0
 
 class Password(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", frozen=True)
     passwordId: str
     userId: str
     spaceId: str
@@ -34,3 +34,7 @@ class Password(BaseModel):
     updatedAt: str
     lastUsed: Optional[str] = None
 
+    @classmethod
+    def from_trusted(cls, data: Dict) -> Self:
+        """Build from a stored document without re-running validation"""
+        return cls.model_construct(**data)
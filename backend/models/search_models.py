@@ -1,10 +1,10 @@
 """
 Search-related Pydantic models
 """
-from pydantic import BaseModel
-from typing import Optional, Dict
+from pydantic import BaseModel, Field
+from typing import Any, Dict
 
 class SearchQuery(BaseModel):
     query: str
-    filters: Optional[Dict] = {}
+    filters: Dict[str, Any] = Field(default_factory=dict)
 
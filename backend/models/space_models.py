@@ -2,7 +2,7 @@
 Space-related Pydantic models
 """
 from pydantic import BaseModel, ConfigDict
-from typing import List
+from typing import List, Dict, Self
 
 class SpaceCreate(BaseModel):
     name: str
@@ -11,7 +11,7 @@ class SpaceCreate(BaseModel):
     admins: List[str] = []
 
 class Space(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", frozen=True)
     spaceId: str
     name: str
     type: str
@@ -20,3 +20,7 @@ class Space(BaseModel):
     admins: List[str] = []
     createdAt: str
 
+    @classmethod
+    def from_trusted(cls, data: Dict) -> Self:
+        """Build from a stored document without re-running validation"""
+        return cls.model_construct(**data)
@@ -2,7 +2,7 @@
 TOTP-related Pydantic models
 """
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import Optional, Dict, Self
 
 class TOTPCreate(BaseModel):
     spaceId: str = "personal"
@@ -14,7 +14,7 @@ class TOTPCreate(BaseModel):
     period: int = 30
 
 class TOTP(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", frozen=True)
     totpId: str
     userId: str
     spaceId: str
@@ -27,3 +27,7 @@ class TOTP(BaseModel):
     createdAt: str
     isShared: Optional[bool] = False
 
+    @classmethod
+    def from_trusted(cls, data: Dict) -> Self:
+        """Build from a stored document without re-running validation"""
+        return cls.model_construct(**data)
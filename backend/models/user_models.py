@@ -1,11 +1,11 @@
 """
 User-related Pydantic models
 """
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Optional, Dict, Self
 
 class User(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", frozen=True)
     userId: str
     email: str
     displayName: Optional[str] = None
@@ -14,7 +14,12 @@ class User(BaseModel):
     lastLogin: str
     passwordEnabled: bool = False
     masterPasswordHash: Optional[str] = None
-    preferences: Optional[Dict] = {}
+    preferences: Dict[str, Any] = Field(default_factory=dict)
+
+    @classmethod
+    def from_trusted(cls, data: Dict) -> Self:
+        """Build from a stored document without re-running validation"""
+        return cls.model_construct(**data)
 
 class UserUpdate(BaseModel):
     displayName: Optional[str] = None
@@ -1,51 +1,126 @@
 """
 Bill Repository - Data access layer for bills
 """
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from firebase_admin import firestore
-from backend.constants import COLLECTIONS, ERROR_MESSAGES
+from backend.constants import COLLECTIONS, ERROR_MESSAGES, QUERY_LIMITS
+from backend.services.cache_service import cache_service
+from collections import defaultdict
+import heapq
 import logging
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+CACHE_TTL = 300
+BILL_CACHE_TTL = 60
+# Separates paidAt from the settlement ID in settlement history cursors
+_CURSOR_SEP = '|'
+
+
+def _to_cents(amount: float) -> int:
+    """Convert a currency amount to integer cents"""
+    return int(round(amount * 100))
+
+
+def _plan_settlements(net_cents: Dict[str, int]) -> List[Dict]:
+    """Pair the largest creditor with the largest debtor until all balances clear (at most N-1 payments)"""
+    # Max-heaps via negated amounts
+    creditors = [(-net, user_id) for user_id, net in net_cents.items() if net > 0]
+    debtors = [(net, user_id) for user_id, net in net_cents.items() if net < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    
+    settlements = []
+    while creditors and debtors:
+        credit, creditor_id = heapq.heappop(creditors)
+        debt, debtor_id = heapq.heappop(debtors)
+        credit, debt = -credit, -debt
+        amount = min(credit, debt)
+        settlements.append({'fromUserId': debtor_id, 'toUserId': creditor_id, 'amount': amount / 100})
+        # Integer cents clear exactly, so no epsilon is needed
+        if credit > amount:
+            heapq.heappush(creditors, (amount - credit, creditor_id))
+        if debt > amount:
+            heapq.heappush(debtors, (amount - debt, debtor_id))
+    return settlements
+
 class BillRepository:
     def __init__(self, db: firestore.Client):
+        if not db:
+            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         self.db = db
         self.collection = COLLECTIONS['BILLS']
         self.settlements_collection = COLLECTIONS['BILL_SETTLEMENTS']
+        self._col = db.collection(self.collection)
+        self._settlements_col = db.collection(self.settlements_collection)
+        self._spaces_col = db.collection(COLLECTIONS['SPACES'])
 
-    def get_by_id(self, bill_id: str) -> Optional[Dict]:
-        """Get bill by ID"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def _invalidate_balances(self, *space_ids: Optional[str]) -> None:
+        """Drop cached balances for spaces whose bills changed"""
+        for space_id in set(space_ids):
+            if space_id:
+                cache_service.delete(f"balances_{space_id}")
+
+    def _invalidate_bill(self, bill_id: str) -> None:
+        """Drop the cached copy of a bill after it changed"""
+        cache_service.delete(f"bill_{bill_id}")
+
+    def get_by_id(self, bill_id: str, use_cache: bool = True) -> Optional[Dict]:
+        """Get bill by ID (pass use_cache=False when the result is the base of a write)"""
+        cache_key = f"bill_{bill_id}"
+        if use_cache:
+            cached = cache_service.get(cache_key)
+            if cached is not None:
+                return cached
+        
         try:
-            doc = self.db.collection(self.collection).document(bill_id).get()
+            doc = self._col.document(bill_id).get()
             if doc.exists:
                 data = doc.to_dict()
                 data['billId'] = doc.id
+                cache_service.set(cache_key, data, BILL_CACHE_TTL)
                 return data
             return None
         except Exception as e:
             logger.error(f"Error fetching bill {bill_id}: {e}", exc_info=True)
             raise
 
+    def get_with_space(self, bill_id: str, space_id: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Get a bill and its space in a single batched read"""
+        try:
+            bill_ref = self._col.document(bill_id)
+            space_ref = self._spaces_col.document(space_id)
+            # get_all does not preserve request order, so match snapshots by path
+            docs = {doc.reference.path: doc for doc in self.db.get_all([bill_ref, space_ref])}
+            
+            bill = None
+            bill_doc = docs.get(bill_ref.path)
+            if bill_doc is not None and bill_doc.exists:
+                bill = bill_doc.to_dict()
+                bill['billId'] = bill_id
+                cache_service.set(f"bill_{bill_id}", bill, BILL_CACHE_TTL)
+            
+            space = None
+            space_doc = docs.get(space_ref.path)
+            if space_doc is not None and space_doc.exists:
+                space = space_doc.to_dict()
+                space['spaceId'] = space_id
+            return bill, space
+        except Exception as e:
+            logger.error(f"Error fetching bill {bill_id} with space {space_id}: {e}", exc_info=True)
+            raise
+
     def get_by_space_id(self, space_id: str) -> List[Dict]:
         """Get all bills for a space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            # Try with order_by first, fallback to without if index is missing
-            try:
-                docs = self.db.collection(self.collection).where('spaceId', '==', space_id).order_by('date', direction=firestore.Query.DESCENDING).stream()
-                bills = [{'billId': doc.id, **doc.to_dict()} for doc in docs]
-            except Exception as order_error:
-                # If order_by fails (missing index), fetch without ordering and sort in Python
-                logger.warning(f"Order by failed (may need Firestore index): {order_error}. Fetching without order_by.")
-                docs = self.db.collection(self.collection).where('spaceId', '==', space_id).stream()
-                bills = [{'billId': doc.id, **doc.to_dict()} for doc in docs]
-                # Sort by date descending in Python
-                bills.sort(key=lambda x: x.get('date', ''), reverse=True)
+            # Ordered server-side by the (spaceId, date DESC) index in firestore.indexes.json
+            docs = self._col.where('spaceId', '==', space_id).order_by('date', direction=firestore.Query.DESCENDING).get()
+            bills = []
+            for doc in docs:
+                data = doc.to_dict()
+                data['billId'] = doc.id
+                bills.append(data)
             return bills
         except Exception as e:
             logger.error(f"Error fetching bills for space {space_id}: {e}", exc_info=True)
@@ -53,8 +128,6 @@ class BillRepository:
 
     def create(self, bill_data: Dict) -> Dict:
         """Create new bill"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
             bill_id = bill_data.get('billId')
             if not bill_id:
@@ -80,81 +153,94 @@ class BillRepository:
             if 'splitType' in bill_doc and not isinstance(bill_doc['splitType'], str):
                 bill_doc['splitType'] = str(bill_doc['splitType'])
             
-            doc_ref = self.db.collection(self.collection).document(bill_id)
+            doc_ref = self._col.document(bill_id)
             doc_ref.set(bill_doc)
             bill_doc['billId'] = bill_id
+            self._invalidate_balances(bill_doc.get('spaceId'))
             return bill_doc
         except Exception as e:
             logger.error(f"Error creating bill: {e}", exc_info=True)
             logger.error(f"Bill data: {bill_data}")
             raise
 
-    def update(self, bill_id: str, updates: Dict) -> None:
+    def update(self, bill_id: str, updates: Dict, space_id: Optional[str] = None) -> None:
         """Update bill"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            doc_ref = self.db.collection(self.collection).document(bill_id)
+            if space_id is None:
+                existing = self.get_by_id(bill_id)
+                space_id = existing.get('spaceId') if existing else None
+            doc_ref = self._col.document(bill_id)
             doc_ref.update(updates)
+            self._invalidate_bill(bill_id)
+            self._invalidate_balances(space_id, updates.get('spaceId'))
         except Exception as e:
             logger.error(f"Error updating bill {bill_id}: {e}", exc_info=True)
             raise
 
-    def delete(self, bill_id: str) -> None:
+    def delete(self, bill_id: str, space_id: Optional[str] = None) -> None:
         """Delete bill"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            doc_ref = self.db.collection(self.collection).document(bill_id)
+            if space_id is None:
+                existing = self.get_by_id(bill_id)
+                space_id = existing.get('spaceId') if existing else None
+            doc_ref = self._col.document(bill_id)
             doc_ref.delete()
+            self._invalidate_bill(bill_id)
+            self._invalidate_balances(space_id)
         except Exception as e:
             logger.error(f"Error deleting bill {bill_id}: {e}", exc_info=True)
             raise
 
-    def mark_participant_paid(self, bill_id: str, user_id: str, amount: float, paid_at: str, notes: Optional[str] = None) -> Dict:
-        """Mark participant as paid and create settlement record"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def mark_participant_paid(self, bill_id: str, user_id: str, amount: float, paid_at: str, notes: Optional[str] = None, space_id: Optional[str] = None) -> Dict:
+        """Mark participant as paid and create settlement record, optionally checking the bill's space"""
         try:
-            # Get bill
-            bill = self.get_by_id(bill_id)
-            if not bill:
-                raise ValueError(ERROR_MESSAGES['BILL_NOT_FOUND'])
-            
-            # Update participant
-            participants = bill.get('participants', [])
-            participant_found = False
-            for participant in participants:
-                if participant.get('userId') == user_id:
-                    participant['paid'] = True
-                    participant['paidAt'] = paid_at
-                    participant_found = True
-                    break
-            
-            if not participant_found:
-                raise ValueError(ERROR_MESSAGES['PARTICIPANT_NOT_FOUND'])
-            
-            # Check if all participants are paid
-            all_paid = all(p.get('paid', False) for p in participants)
-            
-            # Update bill
-            self.update(bill_id, {
-                'participants': participants,
-                'isSettled': all_paid,
-                'updatedAt': datetime.now(timezone.utc).isoformat()
-            })
-            
-            # Create settlement record
-            settlement_id = f"settlement_{bill_id}_{user_id}_{int(datetime.now(timezone.utc).timestamp())}"
-            settlement_data = {
-                'billId': bill_id,
-                'userId': user_id,
-                'amount': amount,
-                'paidAt': paid_at,
-                'notes': notes,
-                'createdAt': datetime.now(timezone.utc).isoformat()
-            }
-            self.db.collection(self.settlements_collection).document(settlement_id).set(settlement_data)
+            bill_ref = self._col.document(bill_id)
+            
+            # The participants array is rewritten from a fresh read inside a transaction,
+            # so concurrent settlements on the same bill cannot overwrite each other
+            @firestore.transactional
+            def apply(transaction) -> Tuple[Dict, Optional[str]]:
+                snapshot = bill_ref.get(transaction=transaction)
+                if not snapshot.exists:
+                    raise ValueError(ERROR_MESSAGES['BILL_NOT_FOUND'])
+                bill = snapshot.to_dict()
+                if space_id is not None and bill.get('spaceId') != space_id:
+                    raise ValueError(ERROR_MESSAGES['BILL_NOT_IN_SPACE'])
+                
+                participants = [dict(p) for p in bill.get('participants', [])]
+                participant = next((p for p in participants if p.get('userId') == user_id), None)
+                if participant is None:
+                    raise ValueError(ERROR_MESSAGES['PARTICIPANT_NOT_FOUND'])
+                participant['paid'] = True
+                participant['paidAt'] = paid_at
+                
+                # Check if all participants are paid
+                all_paid = all(p.get('paid', False) for p in participants)
+                
+                now = datetime.now(timezone.utc)
+                now_iso = now.isoformat()
+                settlement_id = f"settlement_{bill_id}_{user_id}_{int(now.timestamp())}"
+                settlement_data = {
+                    'billId': bill_id,
+                    'spaceId': bill.get('spaceId'),
+                    'userId': user_id,
+                    'amount': amount,
+                    'paidAt': paid_at,
+                    'notes': notes,
+                    'createdAt': now_iso
+                }
+                
+                transaction.update(bill_ref, {
+                    'participants': participants,
+                    'isSettled': all_paid,
+                    'updatedAt': now_iso
+                })
+                transaction.set(self._settlements_col.document(settlement_id), settlement_data)
+                return settlement_data, bill.get('spaceId')
+            
+            settlement_data, bill_space_id = apply(self.db.transaction())
+            self._invalidate_bill(bill_id)
+            self._invalidate_balances(bill_space_id)
             
             return settlement_data
         except Exception as e:
@@ -163,87 +249,121 @@ class BillRepository:
 
     def calculate_balances(self, space_id: str) -> Dict:
         """Calculate net balances (who owes whom) for a space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+        cache_key = f"balances_{space_id}"
+        cached = cache_service.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            bills = self.get_by_space_id(space_id)
+            # Settled bills never contribute, so filter them out server-side on the (spaceId, isSettled) index
+            docs = self._col.where('spaceId', '==', space_id).where('isSettled', '==', False).stream()
             
-            # Track debts and credits for each user
-            user_balances = {}  # {userId: {'debts': 0, 'credits': 0}}
+            # Single pass over unsettled bills: {userId: [debts, credits]} in integer cents
+            user_balances: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+            to_cents = _to_cents
             
-            for bill in bills:
-                if bill.get('isSettled'):
-                    continue  # Skip settled bills
-                
-                participants = bill.get('participants', [])
+            for doc in docs:
+                bill = doc.to_dict()
                 created_by = bill.get('createdBy')
-                total_amount = bill.get('amount', 0)
                 
-                # The creator paid the bill, so they are owed money
-                if created_by not in user_balances:
-                    user_balances[created_by] = {'debts': 0, 'credits': 0}
-                user_balances[created_by]['credits'] += total_amount
+                # The creator paid the bill, so they are owed money; their own share is netted out
+                credit = to_cents(bill.get('amount', 0))
                 
                 # Participants owe their share
-                for participant in participants:
-                    user_id = participant.get('userId')
+                for participant in bill.get('participants', ()):
+                    get = participant.get
+                    user_id = get('userId')
+                    share = to_cents(get('amount', 0))
                     if user_id == created_by:
-                        # Creator's share is already accounted for
-                        user_balances[user_id]['credits'] -= participant.get('amount', 0)
+                        credit -= share
                     else:
-                        if user_id not in user_balances:
-                            user_balances[user_id] = {'debts': 0, 'credits': 0}
-                        user_balances[user_id]['debts'] += participant.get('amount', 0)
+                        user_balances[user_id][0] += share
+                
+                user_balances[created_by][1] += credit
             
             # Calculate net balances
             balances = []
-            for user_id, balance in user_balances.items():
-                net = balance['credits'] - balance['debts']
-                if abs(net) > 0.01:  # Only include significant balances
+            net_cents = {}
+            for user_id, (debts, credits) in user_balances.items():
+                net = credits - debts
+                if net:
+                    net_cents[user_id] = net
                     balances.append({
                         'userId': user_id,
-                        'netBalance': round(net, 2),
-                        'debts': round(balance['debts'], 2),
-                        'credits': round(balance['credits'], 2)
+                        'netBalance': net / 100,
+                        'debts': debts / 100,
+                        'credits': credits / 100
                     })
             
-            return {'balances': balances}
+            result = {'balances': balances, 'settlements': _plan_settlements(net_cents)}
+            cache_service.set(cache_key, result, CACHE_TTL)
+            return result
         except Exception as e:
             logger.error(f"Error calculating balances: {e}", exc_info=True)
             raise
 
-    def get_settlement_history(self, space_id: str) -> List[Dict]:
-        """Get settlement history for a space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def backfill_settlement_space_ids(self) -> int:
+        """Stamp spaceId onto settlements written before it was stored; one-off migration, returns the count updated"""
         try:
-            # Get all bills for the space
-            bills = self.get_by_space_id(space_id)
-            bill_ids = [bill['billId'] for bill in bills]
-            
-            if not bill_ids:
-                return []
+            bill_spaces: Dict[str, Optional[str]] = {}
+            batch = self.db.batch()
+            pending = 0
+            updated = 0
+            for doc in self._settlements_col.stream():
+                data = doc.to_dict() or {}
+                bill_id = data.get('billId')
+                if 'spaceId' in data or not bill_id:
+                    continue
+                if bill_id not in bill_spaces:
+                    bill_doc = self._col.document(bill_id).get()
+                    bill_spaces[bill_id] = (bill_doc.to_dict() or {}).get('spaceId') if bill_doc.exists else None
+                space_id = bill_spaces[bill_id]
+                if not space_id:
+                    continue
+                batch.update(doc.reference, {'spaceId': space_id})
+                pending += 1
+                updated += 1
+                if pending == QUERY_LIMITS['BATCH_WRITE']:
+                    batch.commit()
+                    batch = self.db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+            return updated
+        except Exception as e:
+            logger.error(f"Error backfilling settlement space IDs: {e}", exc_info=True)
+            raise
+
+    def get_settlement_history(self, space_id: str, page_size: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of settlement history for a space, newest first, plus the cursor for the next page
+        
+        The cursor is "<paidAt>|<settlementId>"; the document ID breaks ties between equal paidAt values.
+        """
+        try:
+            # Single query on the (spaceId, paidAt DESC) index in firestore.indexes.json;
+            # __name__ follows the last order direction, so the same index serves the tiebreaker
+            query = (self._settlements_col.where('spaceId', '==', space_id)
+                     .order_by('paidAt', direction=firestore.Query.DESCENDING)
+                     .order_by('__name__', direction=firestore.Query.DESCENDING))
+            if cursor:
+                paid_at, _, settlement_id = cursor.rpartition(_CURSOR_SEP)
+                if settlement_id and paid_at:
+                    query = query.start_after([paid_at, self._settlements_col.document(settlement_id)])
+                else:
+                    # paidAt-only cursors issued before the tiebreaker existed (a prefix of the order-by values)
+                    query = query.start_after([cursor])
             
-            # Get all settlements for these bills
-            # Use individual queries (no order_by to avoid index requirements)
-            # We'll sort in Python instead
             settlements = []
-            for bill_id in bill_ids:
-                try:
-                    docs = self.db.collection(self.settlements_collection).where('billId', '==', bill_id).stream()
-                    for doc in docs:
-                        data = doc.to_dict()
-                        if data:  # Ensure data exists
-                            data['settlementId'] = doc.id
-                            settlements.append(data)
-                except Exception as e:
-                    logger.warning(f"Failed to get settlements for bill {bill_id}: {e}")
-                    continue
+            for doc in query.limit(page_size).get():
+                data = doc.to_dict()
+                data['settlementId'] = doc.id
+                settlements.append(data)
             
-            # Sort by paidAt descending (handle missing paidAt by putting them last)
-            settlements.sort(key=lambda x: x.get('paidAt', ''), reverse=True)
-            return settlements
+            next_cursor = None
+            if len(settlements) == page_size:
+                last = settlements[-1]
+                next_cursor = f"{last['paidAt']}{_CURSOR_SEP}{last['settlementId']}"
+            return settlements, next_cursor
         except Exception as e:
             logger.error(f"Error fetching settlement history: {e}", exc_info=True)
             raise
-
@@ -0,0 +1,60 @@
+"""
+Shared helpers for the per-user item repositories (passwords, TOTPs, notifications)
+"""
+from typing import Callable, Dict, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from backend.constants import QUERY_LIMITS
+
+# Shared by every fetch_user_items call instead of a pool per request
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_LIMITS['PARALLEL_QUERIES'], thread_name_prefix='item-query')
+
+
+def fetch_user_items(col, space_repo, user_id: str, space_id: Optional[str], include_shared: bool, id_field: str, limit: int) -> List[Dict]:
+    """Fetch a user's items from col, optionally filtered by space and including items shared through spaces"""
+    def rows(query, is_shared: Optional[bool] = None, max_rows: int = limit) -> List[Dict]:
+        # stream() hands over one snapshot at a time, so only the dicts are held, not the snapshot list too
+        result = []
+        for doc in query.limit(max_rows).stream():
+            data = doc.to_dict()
+            data[id_field] = doc.id
+            data['isShared'] = data.get('userId') != user_id if is_shared is None else is_shared
+            result.append(data)
+        return result
+
+    if include_shared and space_id and space_id in space_repo.get_member_space_ids(user_id):
+        # Members see every item in the space, so one query covers owned and shared items
+        return rows(col.where('spaceId', '==', space_id))
+
+    if not include_shared or space_id:
+        query = col.where('userId', '==', user_id)
+        if space_id:
+            query = query.where('spaceId', '==', space_id)
+        return rows(query, False)
+
+    def fetch_chunk(chunk: List[str]) -> List[Dict]:
+        # Other members' items only, served by the (spaceId, userId) index in firestore.indexes.json;
+        # the limit applies per space, so a chunk of N spaces may return N times as many rows
+        return rows(col.where('spaceId', 'in', chunk).where('userId', '!=', user_id), True, limit * len(chunk))
+
+    # Owned items and member-space discovery are independent, so overlap their round trips
+    owned_future = _query_executor.submit(rows, col.where('userId', '==', user_id), False)
+    shared_space_ids = space_repo.get_member_space_ids(user_id)
+
+    # One 'in' query per chunk of spaces instead of one query per space
+    chunk_size = QUERY_LIMITS['IN_FILTER']
+    chunks = [shared_space_ids[i:i + chunk_size] for i in range(0, len(shared_space_ids), chunk_size)]
+    shared_results = _query_executor.map(fetch_chunk, chunks)
+
+    items = owned_future.result()
+    for shared in shared_results:
+        items.extend(shared)
+    return items
+
+
+def resolve_owner_id(get_by_id: Callable[[str], Optional[Dict]], item_id: str, user_id: Optional[str]) -> Optional[str]:
+    """Return user_id, or the stored owner of item_id when the caller did not pass one"""
+    if user_id is not None:
+        return user_id
+    # Owner unknown to the caller: read it so the right cache entries are dropped
+    existing = get_by_id(item_id)
+    return existing.get('userId') if existing else None
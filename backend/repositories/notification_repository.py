@@ -3,8 +3,9 @@ Notification Repository - Data access layer for notifications
 """
 from typing import Dict, Optional, List
 from firebase_admin import firestore
-from backend.constants import COLLECTIONS, ERROR_MESSAGES
+from backend.constants import COLLECTIONS, ERROR_MESSAGES, QUERY_LIMITS
 from backend.services.cache_service import cache_service
+from backend.repositories.common import resolve_owner_id
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,44 +14,38 @@ CACHE_TTL = 120
 
 class NotificationRepository:
     def __init__(self, db: firestore.Client):
+        if not db:
+            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         self.db = db
         self.collection = COLLECTIONS['NOTIFICATIONS']
+        self._col = db.collection(self.collection)
 
     def get_by_user_id(self, user_id: str, limit: int = 100) -> List[Dict]:
         """Get notifications by user ID"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
         cache_key = f"notifications_{user_id}_{limit}"
         cached = cache_service.get(cache_key)
         if cached is not None:
             return cached
         
         try:
-            query = self.db.collection(self.collection).where('userId', '==', user_id).order_by('createdAt', direction=firestore.Query.DESCENDING).limit(limit)
-            docs = query.stream()
-            results = [{'notificationId': doc.id, **doc.to_dict()} for doc in docs]
+            # Ordered server-side by the (userId, createdAt DESC) index in firestore.indexes.json
+            query = self._col.where('userId', '==', user_id).order_by('createdAt', direction=firestore.Query.DESCENDING).limit(limit)
+            docs = query.get()
+            results = []
+            for doc in docs:
+                data = doc.to_dict()
+                data['notificationId'] = doc.id
+                results.append(data)
             cache_service.set(cache_key, results, CACHE_TTL)
             return results
         except Exception as e:
-            logger.warning(f"Order by failed for notifications, trying without order: {e}")
-            try:
-                query = self.db.collection(self.collection).where('userId', '==', user_id).limit(limit)
-                docs = query.stream()
-                results = [{'notificationId': doc.id, **doc.to_dict()} for doc in docs]
-                results.sort(key=lambda x: x.get('createdAt', ''), reverse=True)
-                cache_service.set(cache_key, results, CACHE_TTL)
-                return results
-            except Exception as e2:
-                logger.error(f"Error fetching notifications for user {user_id}: {e2}", exc_info=True)
-                raise
+            logger.error(f"Error fetching notifications for user {user_id}: {e}", exc_info=True)
+            raise
 
     def get_by_id(self, notification_id: str) -> Optional[Dict]:
         """Get notification by ID"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            doc = self.db.collection(self.collection).document(notification_id).get()
+            doc = self._col.document(notification_id).get()
             if doc.exists:
                 data = doc.to_dict()
                 data['notificationId'] = doc.id
@@ -62,13 +57,11 @@ class NotificationRepository:
 
     def create(self, notification_data: Dict) -> Dict:
         """Create notification"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
             notification_id = notification_data.pop('notificationId', None)
             if not notification_id:
                 raise ValueError("notificationId is required")
-            doc_ref = self.db.collection(self.collection).document(notification_id)
+            doc_ref = self._col.document(notification_id)
             doc_ref.set(notification_data)
             notification_data['notificationId'] = notification_id
             
@@ -81,37 +74,68 @@ class NotificationRepository:
             logger.error(f"Error creating notification: {e}", exc_info=True)
             raise
 
-    def update(self, notification_id: str, updates: Dict) -> None:
-        """Update notification"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def create_many(self, notifications: List[Dict]) -> List[Dict]:
+        """Create notifications in batched writes (one commit per QUERY_LIMITS['BATCH_WRITE'] documents)"""
         try:
-            existing = self.get_by_id(notification_id)
-            doc_ref = self.db.collection(self.collection).document(notification_id)
-            doc_ref.update(updates)
+            batch_size = QUERY_LIMITS['BATCH_WRITE']
+            for i in range(0, len(notifications), batch_size):
+                batch = self.db.batch()
+                for notification_data in notifications[i:i + batch_size]:
+                    notification_id = notification_data.pop('notificationId', None)
+                    if not notification_id:
+                        raise ValueError("notificationId is required")
+                    batch.set(self._col.document(notification_id), notification_data)
+                    notification_data['notificationId'] = notification_id
+                batch.commit()
             
-            if existing:
-                user_id = existing.get('userId')
+            for user_id in {n.get('userId') for n in notifications}:
                 if user_id:
                     cache_service.invalidate_pattern(f"notifications_{user_id}_")
+            
+            return notifications
+        except Exception as e:
+            logger.error(f"Error creating {len(notifications)} notifications: {e}", exc_info=True)
+            raise
+
+    def update(self, notification_id: str, updates: Dict, user_id: Optional[str] = None) -> None:
+        """Update notification"""
+        try:
+            user_id = resolve_owner_id(self.get_by_id, notification_id, user_id)
+            doc_ref = self._col.document(notification_id)
+            doc_ref.update(updates)
+            
+            if user_id:
+                cache_service.invalidate_pattern(f"notifications_{user_id}_")
         except Exception as e:
             logger.error(f"Error updating notification {notification_id}: {e}", exc_info=True)
             raise
 
-    def delete(self, notification_id: str) -> None:
+    def delete(self, notification_id: str, user_id: Optional[str] = None) -> None:
         """Delete notification"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            existing = self.get_by_id(notification_id)
-            doc_ref = self.db.collection(self.collection).document(notification_id)
+            user_id = resolve_owner_id(self.get_by_id, notification_id, user_id)
+            doc_ref = self._col.document(notification_id)
             doc_ref.delete()
             
-            if existing:
-                user_id = existing.get('userId')
-                if user_id:
-                    cache_service.invalidate_pattern(f"notifications_{user_id}_")
+            if user_id:
+                cache_service.invalidate_pattern(f"notifications_{user_id}_")
         except Exception as e:
             logger.error(f"Error deleting notification {notification_id}: {e}", exc_info=True)
             raise
 
+    def delete_many(self, notification_ids: List[str], user_id: str) -> int:
+        """Delete a user's notifications in batched writes, invalidating their cache once"""
+        try:
+            batch_size = QUERY_LIMITS['BATCH_WRITE']
+            for i in range(0, len(notification_ids), batch_size):
+                batch = self.db.batch()
+                for notification_id in notification_ids[i:i + batch_size]:
+                    batch.delete(self._col.document(notification_id))
+                batch.commit()
+            
+            cache_service.invalidate_pattern(f"notifications_{user_id}_")
+            return len(notification_ids)
+        except Exception as e:
+            logger.error(f"Error deleting {len(notification_ids)} notifications for user {user_id}: {e}", exc_info=True)
+            raise
+
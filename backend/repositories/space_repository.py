@@ -1,64 +1,99 @@
 """
 Space Repository - Data access layer for spaces
 """
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
 from firebase_admin import firestore
-from backend.constants import COLLECTIONS, ERROR_MESSAGES
+from google.api_core.exceptions import NotFound
+from backend.constants import COLLECTIONS, ERROR_MESSAGES, QUERY_LIMITS
 from backend.services.cache_service import cache_service
 import logging
 
 logger = logging.getLogger(__name__)
 
 CACHE_TTL = 300
+MISS_CACHE_TTL = 30
+# Membership changes invalidate spaces_member_* explicitly, so the ID list can live longer
+MEMBER_IDS_CACHE_TTL = 600
+
+# Cached in place of a space that does not exist, so repeated lookups skip Firestore
+_MISS = object()
+
+# Single-flight: concurrent cache misses for one space share a single Firestore read
+_inflight: Dict[str, Future] = {}
+_inflight_lock = Lock()
+
+# Shared by get_all_for_user to overlap its two queries without a pool per call
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_LIMITS['PARALLEL_QUERIES'], thread_name_prefix='space-query')
+
+# Update values that can be merged into a cached space as-is
+_PLAIN_TYPES = (str, int, float, bool, list, dict, type(None))
 
 class SpaceRepository:
     def __init__(self, db: firestore.Client):
+        if not db:
+            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         self.db = db
         self.collection = COLLECTIONS['SPACES']
+        self._col = db.collection(self.collection)
 
-    def get_by_owner_id(self, owner_id: str) -> List[Dict]:
-        """Get spaces by owner ID"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def get_by_owner_id(self, owner_id: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get spaces by owner ID, optionally projected to `fields`"""
         try:
-            docs = self.db.collection(self.collection).where('ownerId', '==', owner_id).stream()
+            query = self._col.where('ownerId', '==', owner_id)
+            if fields:
+                query = query.select(fields)
+            docs = query.stream()
             return [{'spaceId': doc.id, **doc.to_dict()} for doc in docs]
         except Exception as e:
             logger.error(f"Error fetching spaces for owner {owner_id}: {e}", exc_info=True)
             raise
 
-    def get_by_member_id(self, member_id: str) -> List[Dict]:
-        """Get spaces where user is a member"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def get_by_member_id(self, member_id: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get spaces where user is a member, optionally projected to `fields`"""
         try:
-            docs = self.db.collection(self.collection).where('members', 'array_contains', member_id).stream()
+            query = self._col.where('members', 'array_contains', member_id)
+            if fields:
+                query = query.select(fields)
+            docs = query.stream()
             return [{'spaceId': doc.id, **doc.to_dict()} for doc in docs]
         except Exception as e:
             logger.error(f"Error fetching spaces for member {member_id}: {e}", exc_info=True)
             raise
 
+    def get_member_space_ids(self, member_id: str) -> List[str]:
+        """Get IDs of spaces where user is a member, shared through the cache by every repository"""
+        cache_key = f"spaces_member_{member_id}"
+        cached = cache_service.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            space_ids = [doc.id for doc in self._col.where('members', 'array_contains', member_id).stream()]
+            cache_service.set(cache_key, space_ids, MEMBER_IDS_CACHE_TTL)
+            return space_ids
+        except Exception as e:
+            logger.error(f"Error fetching space IDs for member {member_id}: {e}", exc_info=True)
+            raise
+
     def get_all_for_user(self, user_id: str) -> List[Dict]:
         """Get all spaces where user is owner or member"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
         cache_key = f"spaces_user_{user_id}"
         cached = cache_service.get(cache_key)
         if cached is not None:
             return cached
         
         try:
-            owned = self.get_by_owner_id(user_id)
+            # The two queries are independent, so overlap their round trips
+            owned_future = _query_executor.submit(self.get_by_owner_id, user_id)
             member_of = self.get_by_member_id(user_id)
+            owned = owned_future.result()
             
-            space_dict = {}
-            for space in owned + member_of:
-                space_id = space['spaceId']
-                if space_id not in space_dict:
-                    space_dict[space_id] = space
-            
-            result = list(space_dict.values())
+            # Owned spaces are already unique; only member spaces can repeat one of them
+            owned_ids = {space['spaceId'] for space in owned}
+            result = owned
+            result.extend(space for space in member_of if space['spaceId'] not in owned_ids)
             cache_service.set(cache_key, result, CACHE_TTL)
             return result
         except Exception as e:
@@ -67,40 +102,72 @@ class SpaceRepository:
 
     def get_by_id(self, space_id: str) -> Optional[Dict]:
         """Get space by ID"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
         cache_key = f"space_{space_id}"
         cached = cache_service.get(cache_key)
         if cached is not None:
-            return cached
+            return None if cached is _MISS else cached
+        
+        with _inflight_lock:
+            future = _inflight.get(space_id)
+            is_leader = future is None
+            if is_leader:
+                future = _inflight[space_id] = Future()
+        if not is_leader:
+            return future.result()
         
         try:
-            doc = self.db.collection(self.collection).document(space_id).get()
+            doc = self._col.document(space_id).get()
             if doc.exists:
                 data = doc.to_dict()
                 data['spaceId'] = doc.id
-                cache_service.set(cache_key, data, CACHE_TTL)
-                return data
-            return None
+                result = self.cache_space(data)
+            else:
+                cache_service.set(cache_key, _MISS, MISS_CACHE_TTL)
+                result = None
+            future.set_result(result)
+            return result
         except Exception as e:
             logger.error(f"Error fetching space {space_id}: {e}", exc_info=True)
+            future.set_exception(e)
             raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(space_id, None)
+
+    def get_cached(self, space_id: str) -> Optional[Dict]:
+        """Get space from cache only, without touching Firestore"""
+        cached = cache_service.get(f"space_{space_id}")
+        return None if cached is _MISS else cached
+
+    def cache_space(self, data: Dict) -> Dict:
+        """Cache a space dict read from Firestore (must include spaceId)"""
+        # Owner + members as a frozenset for O(1) access checks
+        data['_member_set'] = frozenset(data.get('members', ())) | {data.get('ownerId')}
+        cache_service.set(f"space_{data['spaceId']}", data, CACHE_TTL)
+        return data
 
     def create(self, space_data: Dict) -> Dict:
         """Create space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
             space_id = space_data.pop('spaceId')
             owner_id = space_data.get('ownerId')
-            doc_ref = self.db.collection(self.collection).document(space_id)
+            doc_ref = self._col.document(space_id)
             doc_ref.set(space_data)
             space_data['spaceId'] = space_id
             
+            # Write-through: the new space is cached as written instead of being re-read later
+            self.cache_space(dict(space_data))
             if owner_id:
-                cache_service.invalidate_pattern(f"spaces_user_{owner_id}")
-                cache_service.invalidate_pattern(f"spaces_member_{owner_id}")
+                owned_key = f"spaces_user_{owner_id}"
+                owned = cache_service.get(owned_key)
+                if owned is not None:
+                    cache_service.set(owned_key, owned + [space_data], CACHE_TTL)
+            
+            keys = []
+            for member_id in space_data.get('members', []):
+                keys += (f"spaces_user_{member_id}", f"spaces_member_{member_id}")
+            if keys:
+                cache_service.invalidate_many(keys=keys)
             
             return space_data
         except Exception as e:
@@ -109,90 +176,93 @@ class SpaceRepository:
 
     def update(self, space_id: str, updates: Dict) -> None:
         """Update space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
             existing = self.get_by_id(space_id)
-            doc_ref = self.db.collection(self.collection).document(space_id)
+            doc_ref = self._col.document(space_id)
             doc_ref.update(updates)
             
-            cache_service.delete(f"space_{space_id}")
+            keys = [f"space_{space_id}"]
             if existing:
+                # Plain values can be merged into the cached space; transforms such as ArrayUnion cannot
+                if all(isinstance(v, _PLAIN_TYPES) for v in updates.values()):
+                    self.cache_space(self._patched(existing, space_id, **updates))
+                    keys = []
                 owner_id = existing.get('ownerId')
-                members = existing.get('members', [])
                 if owner_id:
-                    cache_service.invalidate_pattern(f"spaces_user_{owner_id}")
-                for member_id in members:
-                    cache_service.invalidate_pattern(f"spaces_user_{member_id}")
-                    cache_service.invalidate_pattern(f"spaces_member_{member_id}")
+                    keys.append(f"spaces_user_{owner_id}")
+                for member_id in existing.get('members', []):
+                    keys.append(f"spaces_user_{member_id}")
+                    # Member space ids only change when membership does
+                    if 'members' in updates:
+                        keys.append(f"spaces_member_{member_id}")
+            # Exact keys: one dict delete per member instead of a prefix scan of the whole cache
+            cache_service.invalidate_many(keys=keys)
         except Exception as e:
             logger.error(f"Error updating space {space_id}: {e}", exc_info=True)
             raise
 
     def delete(self, space_id: str) -> None:
         """Delete space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            doc_ref = self.db.collection(self.collection).document(space_id)
+            doc_ref = self._col.document(space_id)
             doc_ref.delete()
         except Exception as e:
             logger.error(f"Error deleting space {space_id}: {e}", exc_info=True)
             raise
 
-    def add_member(self, space_id: str, member_id: str) -> Dict:
-        """Add member to space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        try:
+    def _invalidate_membership(self, space_id: str, member_id: str) -> None:
+        """Drop cached views that depend on a member joining or leaving a space"""
+        cache_service.invalidate_many(
+            (f"passwords_{member_id}_", f"totps_{member_id}_"),
+            keys=[f"space_{space_id}", f"spaces_user_{member_id}", f"spaces_member_{member_id}"]
+        )
+
+    @staticmethod
+    def _patched(existing: Dict, space_id: str, **fields) -> Dict:
+        """Copy of a loaded space with fields replaced, returned after a write instead of re-reading it"""
+        data = {k: v for k, v in existing.items() if k != '_member_set'}
+        data.update(fields)
+        data['spaceId'] = space_id
+        return data
+
+    def _update_array(self, space_id: str, field: str, value: str, add: bool, existing: Optional[Dict]) -> Dict:
+        """Add or remove one value of an array field with a server-side transform"""
+        if existing is None:
             existing = self.get_by_id(space_id)
-            if not existing:
-                raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
-            
-            doc_ref = self.db.collection(self.collection).document(space_id)
-            members = existing.get('members', [])
-            if member_id not in members:
-                members.append(member_id)
-                doc_ref.update({'members': members})
-            
+        if not existing:
+            raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
+        
+        # ArrayUnion/ArrayRemove apply atomically on the server, so concurrent edits are not lost;
+        # update() itself fails if the space was deleted after `existing` was read
+        transform = firestore.ArrayUnion([value]) if add else firestore.ArrayRemove([value])
+        try:
+            self._col.document(space_id).update({field: transform})
+        except NotFound:
             cache_service.delete(f"space_{space_id}")
-            cache_service.invalidate_pattern(f"spaces_user_{member_id}")
-            cache_service.invalidate_pattern(f"spaces_member_{member_id}")
-            cache_service.invalidate_pattern(f"passwords_{member_id}_")
-            cache_service.invalidate_pattern(f"totps_{member_id}_")
+            raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
+        
+        values = [v for v in existing.get(field, []) if v != value]
+        if add:
+            values.append(value)
+        return self._patched(existing, space_id, **{field: values})
+
+    def add_member(self, space_id: str, member_id: str, existing: Optional[Dict] = None) -> Dict:
+        """Add member to space (pass `existing` if the space is already loaded to skip the read)"""
+        try:
+            updated_data = self._update_array(space_id, 'members', member_id, True, existing)
             
-            updated_doc = doc_ref.get()
-            updated_data = updated_doc.to_dict()
-            updated_data['spaceId'] = space_id
+            self._invalidate_membership(space_id, member_id)
             return updated_data
         except Exception as e:
             logger.error(f"Error adding member to space {space_id}: {e}", exc_info=True)
             raise
 
-    def remove_member(self, space_id: str, member_id: str) -> Dict:
-        """Remove member from space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def remove_member(self, space_id: str, member_id: str, existing: Optional[Dict] = None) -> Dict:
+        """Remove member from space (pass `existing` if the space is already loaded to skip the read)"""
         try:
-            existing = self.get_by_id(space_id)
-            if not existing:
-                raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
+            updated_data = self._update_array(space_id, 'members', member_id, False, existing)
             
-            doc_ref = self.db.collection(self.collection).document(space_id)
-            members = existing.get('members', [])
-            if member_id in members:
-                members.remove(member_id)
-                doc_ref.update({'members': members})
-            
-            cache_service.delete(f"space_{space_id}")
-            cache_service.invalidate_pattern(f"spaces_user_{member_id}")
-            cache_service.invalidate_pattern(f"spaces_member_{member_id}")
-            cache_service.invalidate_pattern(f"passwords_{member_id}_")
-            cache_service.invalidate_pattern(f"totps_{member_id}_")
-            
-            updated_doc = doc_ref.get()
-            updated_data = updated_doc.to_dict()
-            updated_data['spaceId'] = space_id
+            self._invalidate_membership(space_id, member_id)
             return updated_data
         except Exception as e:
             logger.error(f"Error removing member from space {space_id}: {e}", exc_info=True)
@@ -200,85 +270,51 @@ class SpaceRepository:
 
     def transfer_ownership(self, space_id: str, new_owner_id: str) -> Dict:
         """Transfer space ownership"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            existing = self.get_by_id(space_id)
-            if not existing:
-                raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
-            
-            old_owner_id = existing.get('ownerId')
-            doc_ref = self.db.collection(self.collection).document(space_id)
+            doc_ref = self._col.document(space_id)
             
-            updates = {'ownerId': new_owner_id}
-            members = existing.get('members', [])
-            if old_owner_id not in members:
-                members.append(old_owner_id)
-            updates['members'] = members
-            if new_owner_id in members:
-                members.remove(new_owner_id)
-                updates['members'] = members
-            
-            doc_ref.update(updates)
+            # ownerId and members change together, so read and write them in one transaction
+            @firestore.transactional
+            def apply(transaction) -> Tuple[Optional[str], Dict]:
+                snapshot = doc_ref.get(transaction=transaction)
+                if not snapshot.exists:
+                    raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
+                data = snapshot.to_dict()
+                old_owner = data.get('ownerId')
+                members = [m for m in data.get('members', []) if m != new_owner_id]
+                if old_owner and old_owner not in members:
+                    members.append(old_owner)
+                transaction.update(doc_ref, {'ownerId': new_owner_id, 'members': members})
+                return old_owner, self._patched(data, space_id, ownerId=new_owner_id, members=members)
             
-            cache_service.delete(f"space_{space_id}")
-            if old_owner_id:
-                cache_service.invalidate_pattern(f"spaces_user_{old_owner_id}")
-            cache_service.invalidate_pattern(f"spaces_user_{new_owner_id}")
+            old_owner_id, updated_data = apply(self.db.transaction())
             
-            updated_doc = doc_ref.get()
-            updated_data = updated_doc.to_dict()
-            updated_data['spaceId'] = space_id
+            # Both users' membership changed along with ownership
+            keys = [f"space_{space_id}"]
+            for user_id in (old_owner_id, new_owner_id):
+                if user_id:
+                    keys += (f"spaces_user_{user_id}", f"spaces_member_{user_id}")
+            cache_service.invalidate_many(keys=keys)
             return updated_data
         except Exception as e:
             logger.error(f"Error transferring ownership of space {space_id}: {e}", exc_info=True)
             raise
 
-    def add_admin(self, space_id: str, admin_id: str) -> Dict:
-        """Add admin to space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def add_admin(self, space_id: str, admin_id: str, existing: Optional[Dict] = None) -> Dict:
+        """Add admin to space (pass `existing` if the space is already loaded to skip the read)"""
         try:
-            existing = self.get_by_id(space_id)
-            if not existing:
-                raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
-            
-            doc_ref = self.db.collection(self.collection).document(space_id)
-            admins = existing.get('admins', [])
-            if admin_id not in admins:
-                admins.append(admin_id)
-                doc_ref.update({'admins': admins})
-            
+            updated_data = self._update_array(space_id, 'admins', admin_id, True, existing)
             cache_service.delete(f"space_{space_id}")
-            
-            updated_doc = doc_ref.get()
-            updated_data = updated_doc.to_dict()
-            updated_data['spaceId'] = space_id
             return updated_data
         except Exception as e:
             logger.error(f"Error adding admin to space {space_id}: {e}", exc_info=True)
             raise
 
-    def remove_admin(self, space_id: str, admin_id: str) -> Dict:
-        """Remove admin from space"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
+    def remove_admin(self, space_id: str, admin_id: str, existing: Optional[Dict] = None) -> Dict:
+        """Remove admin from space (pass `existing` if the space is already loaded to skip the read)"""
         try:
-            existing = self.get_by_id(space_id)
-            if not existing:
-                raise ValueError(ERROR_MESSAGES['SPACE_NOT_FOUND'])
-            
-            doc_ref = self.db.collection(self.collection).document(space_id)
-            admins = existing.get('admins', [])
-            if admin_id in admins:
-                admins.remove(admin_id)
-                doc_ref.update({'admins': admins})
-            
+            updated_data = self._update_array(space_id, 'admins', admin_id, False, existing)
             cache_service.delete(f"space_{space_id}")
-            
-            updated_doc = doc_ref.get()
-            updated_data = updated_doc.to_dict()
-            updated_data['spaceId'] = space_id
             return updated_data
         except Exception as e:
             logger.error(f"Error removing admin from space {space_id}: {e}", exc_info=True)
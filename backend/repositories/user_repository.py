@@ -3,7 +3,7 @@ User Repository - Data access layer for users
 """
 from typing import Dict, Optional, List
 from firebase_admin import firestore, auth
-from backend.constants import COLLECTIONS, ERROR_MESSAGES
+from backend.constants import COLLECTIONS, ERROR_MESSAGES, QUERY_LIMITS
 from backend.services.cache_service import cache_service
 import logging
 
@@ -14,21 +14,21 @@ SEARCH_CACHE_TTL = 120
 
 class UserRepository:
     def __init__(self, db: firestore.Client):
+        if not db:
+            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         self.db = db
         self.collection = COLLECTIONS['USERS']
+        self._col = db.collection(self.collection)
 
     def get_by_id(self, user_id: str) -> Optional[Dict]:
         """Get user by ID (excludes inactive users unless explicitly requested)"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
-        
         cache_key = f"user_{user_id}"
         cached = cache_service.get(cache_key)
         if cached is not None:
             return cached
         
         try:
-            doc = self.db.collection(self.collection).document(user_id).get()
+            doc = self._col.document(user_id).get()
             if doc.exists:
                 data = doc.to_dict()
                 if data.get('active') is False:
@@ -41,13 +41,24 @@ class UserRepository:
             logger.error(f"Error fetching user {user_id}: {e}", exc_info=True)
             raise
 
+    @staticmethod
+    def search_fields(data: Dict) -> Dict:
+        """Lowercased copies of email/displayName that search() range-queries on"""
+        fields = {}
+        if 'email' in data:
+            fields['email_lower'] = (data['email'] or '').lower()
+        if 'displayName' in data:
+            fields['displayName_lower'] = (data['displayName'] or '').lower()
+        return fields
+
     def create(self, user_data: Dict) -> Dict:
         """Create user"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
             user_id = user_data['userId']
-            doc_ref = self.db.collection(self.collection).document(user_id)
+            user_data.update(self.search_fields(user_data))
+            # search() filters on active == True server-side, so every doc carries the flag
+            user_data.setdefault('active', True)
+            doc_ref = self._col.document(user_id)
             doc_ref.set(user_data)
             cache_service.set(f"user_{user_id}", user_data, CACHE_TTL)
             return user_data
@@ -57,18 +68,54 @@ class UserRepository:
 
     def update(self, user_id: str, updates: Dict) -> None:
         """Update user"""
-        if not self.db:
-            raise ValueError(ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
         try:
-            doc_ref = self.db.collection(self.collection).document(user_id)
-            doc_ref.update(updates)
+            doc_ref = self._col.document(user_id)
+            doc_ref.update({**updates, **self.search_fields(updates)})
             cache_service.delete(f"user_{user_id}")
         except Exception as e:
             logger.error(f"Error updating user {user_id}: {e}", exc_info=True)
             raise
 
+    def backfill_search_fields(self) -> int:
+        """Stamp the fields search() filters on (active and the *_lower copies) onto users created before they existed;
+        one-off migration, returns the count updated"""
+        try:
+            batch = self.db.batch()
+            pending = 0
+            updated = 0
+            for doc in self._col.stream():
+                data = doc.to_dict() or {}
+                missing = {k: v for k, v in self.search_fields(data).items() if data.get(k) != v}
+                if 'active' not in data:
+                    missing['active'] = True
+                if not missing:
+                    continue
+                batch.update(doc.reference, missing)
+                pending += 1
+                updated += 1
+                if pending == QUERY_LIMITS['BATCH_WRITE']:
+                    batch.commit()
+                    batch = self.db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+            return updated
+        except Exception as e:
+            logger.error(f"Error backfilling user search fields: {e}", exc_info=True)
+            raise
+
+    @staticmethod
+    def _search_result(user_id: str, data: Dict) -> Dict:
+        """Public profile fields returned by search()"""
+        return {
+            'userId': user_id,
+            'email': data.get('email') or '',
+            'displayName': data.get('displayName') or '',
+            'photoURL': data.get('photoURL') or ''
+        }
+
     def search(self, query: str, limit: int = 20) -> List[Dict]:
-        """Search users by name or email in Firestore and Firebase Auth"""
+        """Search users by email or display name prefix"""
         search_query = query.lower().strip()
         if not search_query or len(search_query) < 2:
             logger.warning(f"Search query too short: '{query}'")
@@ -79,127 +126,45 @@ class UserRepository:
         if cached is not None:
             return cached
         
-        logger.info(f"🔍 Starting user search for query: '{query}' (normalized: '{search_query}')")
         results = []
         seen_user_ids = set()
         
-        logger.info("📍 Searching Firebase Authentication users...")
         try:
-            max_pages = 3
-            page = auth.list_users(max_results=1000)
-            page_count = 0
-            total_users_checked = 0
-            
-            while page and page_count < max_pages:
-                users_list = list(page.users)
-                total_users_checked += len(users_list)
-                logger.info(f"  📄 Page {page_count + 1}: Checking {len(users_list)} users (total checked: {total_users_checked})")
-                
-                for user_record in users_list:
-                    if len(results) >= limit:
-                        break
-                    
-                    user_id = user_record.uid
-                    if user_id in seen_user_ids:
-                        continue
-                    
-                    email = (user_record.email or '').lower()
-                    display_name = (user_record.display_name or '').lower()
-                    
-                    # Log each user being checked (for debugging)
-                    logger.debug(f"  👤 Checking user: {user_record.email} (name: {user_record.display_name})")
-                    
-                    # Check if search query matches email or display name
-                    email_match = search_query in email
-                    name_match = search_query in display_name
-                    
-                    if email_match or name_match:
-                        logger.info(f"  ✅ MATCH FOUND: {user_record.email} (email_match: {email_match}, name_match: {name_match})")
-                        # Check if user exists in Firestore for additional data
-                        firestore_user = None
-                        if self.db:
-                            try:
-                                doc = self.db.collection(self.collection).document(user_id).get()
-                                if doc.exists:
-                                    firestore_user = doc.to_dict()
-                                    logger.debug(f"  📝 Found Firestore data for {user_id}")
-                            except Exception as fs_error:
-                                logger.debug(f"  ⚠️  Firestore lookup failed for {user_id}: {fs_error}")
-                        
-                        results.append({
-                            'userId': user_id,
-                            'email': user_record.email or '',
-                            'displayName': firestore_user.get('displayName') if firestore_user else user_record.display_name or '',
-                            'photoURL': firestore_user.get('photoURL') if firestore_user else user_record.photo_url or ''
-                        })
-                        seen_user_ids.add(user_id)
-                
+            # Prefix range queries on the lowercased fields: reads scale with matches, not with users
+            upper = search_query + '\uf8ff'
+            for field in ('email_lower', 'displayName_lower'):
                 if len(results) >= limit:
                     break
-                
-                page_count += 1
-                # Get next page if available
-                try:
-                    page = page.get_next_page()
-                except Exception as page_error:
-                    logger.debug(f"  📄 No more pages available: {page_error}")
-                    page = None
-                    break
-            
-            logger.info(f"✅ Firebase Auth search complete: Found {len(results)} users matching '{query}' (checked {total_users_checked} total users)")
-            
+                # Soft-deleted users are excluded by the query, served by the (active, *_lower) indexes
+                docs = (self._col.where('active', '==', True)
+                        .where(field, '>=', search_query).where(field, '<', upper)
+                        .limit(limit).stream())
+                for doc in docs:
+                    if doc.id in seen_user_ids:
+                        continue
+                    user_data = doc.to_dict()
+                    results.append(self._search_result(doc.id, user_data))
+                    seen_user_ids.add(doc.id)
         except Exception as e:
-            logger.error(f"❌ Error searching Firebase Auth users: {e}", exc_info=True)
-            # Fall back to Firestore search if Auth search fails
-            # Check if it's a permissions issue
-            if 'permission' in str(e).lower() or 'unauthorized' in str(e).lower():
-                logger.error("🔒 Firebase Admin Auth permissions issue. Ensure service account has 'Firebase Authentication Admin' role.")
-            else:
-                logger.error(f"🔒 Firebase Auth error type: {type(e).__name__}, message: {str(e)}")
+            logger.error(f"Error searching Firestore users: {e}", exc_info=True)
         
-        # If we haven't reached the limit, also search Firestore for users not in Auth
-        if len(results) < limit and self.db:
-            logger.info(f"📍 Searching Firestore users collection (need {limit - len(results)} more results)...")
+        # Users who never opened a session have no Firestore doc; an exact email can still find them in Auth
+        if len(results) < limit and '@' in search_query:
             try:
-                # Filter out inactive users (active field is not False)
-                all_users = self.db.collection(self.collection).limit(500).stream()
-                firestore_count = 0
-                
-                for doc in all_users:
-                    if len(results) >= limit:
-                        break
-                    
-                    user_id = doc.id
-                    if user_id in seen_user_ids:
-                        continue
-                    
-                    firestore_count += 1
-                    user_data = doc.to_dict()
-                    # Filter out inactive users (soft deleted)
-                    if user_data.get('active') is False:
-                        continue
-                    
-                    email = user_data.get('email', '').lower()
-                    display_name = user_data.get('displayName', '').lower()
-                    
-                    # Check if search query matches email or display name
-                    if search_query in email or search_query in display_name:
-                        logger.info(f"  ✅ Firestore MATCH: {user_data.get('email')}")
-                        results.append({
-                            'userId': user_id,
-                            'email': user_data.get('email', ''),
-                            'displayName': user_data.get('displayName', ''),
-                            'photoURL': user_data.get('photoURL', '')
-                        })
-                        seen_user_ids.add(user_id)
-                
-                logger.info(f"✅ Firestore search complete: Checked {firestore_count} users, found {len(results)} total matches")
-                
+                user_record = auth.get_user_by_email(search_query)
+                if user_record.uid not in seen_user_ids:
+                    results.append({
+                        'userId': user_record.uid,
+                        'email': user_record.email or '',
+                        'displayName': user_record.display_name or '',
+                        'photoURL': user_record.photo_url or ''
+                    })
+            except auth.UserNotFoundError:
+                pass
             except Exception as e:
-                logger.error(f"❌ Error searching Firestore users: {e}", exc_info=True)
+                logger.error(f"Error looking up Auth user by email: {e}", exc_info=True)
         
         final_results = results[:limit]
         cache_service.set(cache_key, final_results, SEARCH_CACHE_TTL)
-        logger.info(f"🎯 FINAL RESULT: Returning {len(final_results)} users for query '{query}'")
+        logger.info(f"User search for '{query}' returned {len(final_results)} users")
         return final_results
-
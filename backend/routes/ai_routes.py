@@ -1,13 +1,15 @@
 """
 AI Assistant routes with SSE streaming
 """
-import json
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+import re
+from typing import AsyncIterator
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import StreamingResponse
 from backend.models import AIChatRequest, AIQuery
 from backend.middleware.auth import verify_token
-from backend.middleware.rate_limit import check_rate_limit
+from backend.middleware.rate_limit import ai_rate_limit_dep, rate_limit_dep
 from backend.services.intent_guard import IntentGuard, IntentType
 from backend.services.guard_rails import GuardRails
 from backend.services.conversation_buffer import get_session
@@ -24,7 +26,25 @@ intent_guard = IntentGuard()
 guard_rails = GuardRails()
 
 
-async def stream_ai_response(user_id: str, message: str, session_id: str = None):
+# Pre-encoded SSE framing; events are yielded as bytes so StreamingResponse sends them as-is
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+# Static envelope around each streamed text chunk
+_TEXT_CHUNK_PREFIX = _SSE_PREFIX + b'{"type":"text","content":'
+_TEXT_CHUNK_SUFFIX = b'}' + _SSE_SUFFIX
+
+
+# Phrases showing the assistant asked the user for more input (substring match, as before)
+_FOLLOWUP_RE = re.compile(r"need|provide|missing|information|tell me|what is", re.IGNORECASE)
+
+
+def _sse(payload: dict) -> bytes:
+    """Encode one SSE data event"""
+    return b"".join((_SSE_PREFIX, orjson.dumps(payload), _SSE_SUFFIX))
+
+
+async def stream_ai_response(user_id: str, message: str, session_id: str = None, typewriter: bool = False) -> AsyncIterator[bytes]:
     """
     Stream AI response using SSE
     """
@@ -39,7 +59,7 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
         if is_first:
             greeting = buffer.get_greeting()
             buffer.add_message("assistant", greeting)
-            yield f"data: {json.dumps({'type': 'text', 'content': greeting})}\n\n"
+            yield _sse({'type': 'text', 'content': greeting})
             # Minimal delay to ensure greeting is sent
             await asyncio.sleep(0.05)
         
@@ -58,7 +78,7 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
         if not validation.get("is_valid"):
             error_msg = validation.get("reason", "Request blocked for security reasons")
             buffer.add_message("assistant", error_msg)
-            yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+            yield _sse({'type': 'error', 'content': error_msg})
             return
         
         # Classify intent (with conversation context for follow-up questions)
@@ -73,18 +93,8 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
             optional = intent_result["optional_parameters"]
             
             # Check if this is a follow-up (assistant asked for info in last message)
-            is_followup = False
-            if conversation_history and len(conversation_history) > 1:
-                last_assistant_msg = None
-                for msg in reversed(conversation_history[:-1]):  # Exclude current user message
-                    if msg.get("role") == "assistant":
-                        last_assistant_msg = msg.get("content", "")
-                        break
-                
-                if last_assistant_msg and any(phrase in last_assistant_msg.lower() for phrase in [
-                    "need", "provide", "missing", "information", "tell me", "what is"
-                ]):
-                    is_followup = True
+            last_assistant_msg = buffer.last_assistant_message()
+            is_followup = bool(last_assistant_msg and _FOLLOWUP_RE.search(last_assistant_msg))
             
             # If it's a follow-up, let AI handle it naturally instead of blocking
             if not is_followup:
@@ -96,7 +106,7 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
                 response_text += "Please provide the missing information."
                 
                 buffer.add_message("assistant", response_text)
-                yield f"data: {json.dumps({'type': 'text', 'content': response_text})}\n\n"
+                yield _sse({'type': 'text', 'content': response_text})
                 return
         
         # Get conversation messages for AI (includes current user message)
@@ -124,7 +134,7 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
             if not is_first:
                 error_msg = "I'm having trouble processing your request. Please try again."
                 buffer.add_message("assistant", error_msg)
-                yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+                yield _sse({'type': 'error', 'content': error_msg})
             return
         
         # Handle errors from AI service
@@ -133,28 +143,24 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
             # Only show error if it's a real error, not just a warning
             if error_msg and "not available" not in error_msg.lower():
                 buffer.add_message("assistant", error_msg)
-                yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+                yield _sse({'type': 'error', 'content': error_msg})
             return
         
         # Stream text response
         if ai_response.get("text"):
-            # Stream text in chunks for visible effect
             text = ai_response["text"]
             
-            # Send in smaller chunks for visible streaming effect
-            chunk_size = 5
-            full_text = ""
+            # The full reply is already known, so send it in ~40 chunks rather than 5 characters at a time
+            chunk_size = max(64, len(text) // 40)
             for i in range(0, len(text), chunk_size):
-                chunk = text[i:i+chunk_size]
-                full_text += chunk
-                yield f"data: {json.dumps({'type': 'text', 'content': chunk})}\n\n"
-                # Small delay to make streaming visible
-                if i + chunk_size < len(text):  # Don't delay on last chunk
-                    await asyncio.sleep(0.015)  # Visible but not too slow
+                yield b"".join((_TEXT_CHUNK_PREFIX, orjson.dumps(text[i:i + chunk_size]), _TEXT_CHUNK_SUFFIX))
+                # Typewriter pacing only when the client asks for it
+                if typewriter and i + chunk_size < len(text):
+                    await asyncio.sleep(0.015)
             
             # Add complete message to buffer only if we have text
-            if full_text.strip():
-                buffer.add_message("assistant", full_text)
+            if text.strip():
+                buffer.add_message("assistant", text)
         
         # Handle tool calls
         if ai_response.get("tool_calls"):
@@ -163,7 +169,7 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
                 tool_result = tool_call["result"]
                 
                 # Send tool call notification
-                yield f"data: {json.dumps({'type': 'tool_call', 'tool_name': tool_name, 'tool_args': tool_call['arguments']})}\n\n"
+                yield _sse({'type': 'tool_call', 'tool_name': tool_name, 'tool_args': tool_call['arguments']})
                 
                 # Send tool result
                 if tool_result.get("success"):
@@ -185,35 +191,27 @@ async def stream_ai_response(user_id: str, message: str, session_id: str = None)
                     tool_message = f"Executed {tool_name}: {tool_result.get('message', '')}"
                     buffer.add_message("assistant", tool_message)
                     
-                    yield f"data: {json.dumps(result_data)}\n\n"
+                    yield _sse(result_data)
                 else:
                     error_msg = tool_result.get("error", "Tool execution failed")
                     buffer.add_message("assistant", f"Error: {error_msg}")
-                    yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+                    yield _sse({'type': 'error', 'content': error_msg})
         
         # Send completion
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+        yield _sse({'type': 'done'})
         
     except Exception as e:
         logger.error(f"Error in stream_ai_response: {e}", exc_info=True)
-        yield f"data: {json.dumps({'type': 'error', 'content': 'An error occurred. Please try again.'})}\n\n"
+        yield _sse({'type': 'error', 'content': 'An error occurred. Please try again.'})
 
 
-@router.post("/chat/stream")
-async def ai_chat_stream(request: AIChatRequest, token_data: dict = Depends(verify_token)):
+@router.post("/chat/stream", dependencies=[Depends(ai_rate_limit_dep)])
+async def ai_chat_stream(request: AIChatRequest, typewriter: bool = Query(False), token_data: dict = Depends(verify_token)):
     """
     SSE endpoint for AI chat with streaming responses
     """
     user_id = token_data['uid']
     
-    # Check rate limit
-    is_allowed, rate_info = check_rate_limit(user_id)
-    if not is_allowed:
-        raise HTTPException(
-            status_code=429,
-            detail=rate_info
-        )
-    
     # Validate message
     if not request.message or not request.message.strip():
         raise HTTPException(status_code=400, detail="Message is required")
@@ -222,7 +220,7 @@ async def ai_chat_stream(request: AIChatRequest, token_data: dict = Depends(veri
     session_id = request.session_id
     
     return StreamingResponse(
-        stream_ai_response(user_id, request.message.strip(), session_id),
+        stream_ai_response(user_id, request.message.strip(), session_id, typewriter),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -232,21 +230,13 @@ async def ai_chat_stream(request: AIChatRequest, token_data: dict = Depends(veri
     )
 
 
-@router.post("/chat")
+@router.post("/chat", dependencies=[Depends(ai_rate_limit_dep)])
 async def ai_chat(query: AIQuery, token_data: dict = Depends(verify_token)):
     """
     Legacy endpoint for backward compatibility (non-streaming)
     """
     user_id = token_data['uid']
     
-    # Check rate limit
-    is_allowed, rate_info = check_rate_limit(user_id)
-    if not is_allowed:
-        raise HTTPException(
-            status_code=429,
-            detail=rate_info
-        )
-    
     try:
         # Get session
         buffer = get_session()
@@ -285,7 +275,7 @@ async def ai_chat(query: AIQuery, token_data: dict = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"AI chat failed: {str(e)}")
 
 
-@router.post("/analyze-passwords")
+@router.post("/analyze-passwords", dependencies=[Depends(rate_limit_dep)])
 async def analyze_passwords(token_data: dict = Depends(verify_token)):
     """
     Analyze passwords for security issues (metadata only)
@@ -1,7 +1,6 @@
 """
 Authentication routes
 """
-import os
 import uuid
 import jwt
 import logging
@@ -10,18 +9,19 @@ from datetime import datetime, timezone, timedelta
 from fastapi import APIRouter, HTTPException, Depends
 from backend.models import User, SessionCreate, SessionResponse, PasswordAuth
 from backend.middleware.auth import verify_token, verify_firebase_token
-from backend.config import db
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import JWT_SECRET, get_user_repo, get_space_repo, get_notification_repo
 from backend.constants import ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-# Initialize repositories (imported from config to avoid circular imports)
-from backend.config import user_repo, space_repo, notification_repo
-
 @router.post("/session", response_model=SessionResponse)
 async def create_session(session_data: SessionCreate):
+    user_repo = get_user_repo()
+    space_repo = get_space_repo()
+    notification_repo = get_notification_repo()
     try:
         # Verify Firebase ID token
         try:
@@ -75,8 +75,13 @@ async def create_session(session_data: SessionCreate):
                 }
                 space_repo.create({"spaceId": space_id, **space_doc})
         else:
-            # Update last login
-            user_repo.update(user_id, {"lastLogin": now})
+            # Update last login, backfilling the search fields on users created before they existed
+            updates = {"lastLogin": now}
+            if 'email_lower' not in existing_user:
+                updates.update(user_repo.search_fields(existing_user))
+            if 'active' not in existing_user:
+                updates['active'] = True
+            user_repo.update(user_id, updates)
         
         # Create login notification for the user (only if this is a new login, not a session refresh)
         # Check if there's already a recent login notification (within last 5 minutes)
@@ -141,9 +146,10 @@ async def create_session(session_data: SessionCreate):
         if space_repo and notification_repo:
             try:
                 # Get all spaces where user is a member
-                member_spaces = space_repo.get_by_member_id(user_id)
+                member_spaces = space_repo.get_by_member_id(user_id, fields=['ownerId', 'name'])
                 user_display_name = existing_user.get('displayName') if existing_user else decoded_token.get('name', 'User')
                 
+                owner_notifications = []
                 for space in member_spaces:
                     owner_id = space.get('ownerId')
                     if owner_id and owner_id != user_id:
@@ -160,21 +166,25 @@ async def create_session(session_data: SessionCreate):
                                 "read": False,
                                 "createdAt": now
                             }
-                            notification_repo.create(notification_doc)
+                            owner_notifications.append(notification_doc)
+                
+                # One batched write for the whole fan-out instead of a round trip per owner
+                if owner_notifications:
+                    notification_repo.create_many(owner_notifications)
             except Exception as space_notif_error:
                 logger.warning(f"Failed to create space member login notifications: {space_notif_error}")
         
         # Create session
         session_token = jwt.encode(
             {"userId": user_id, "exp": datetime.now(timezone.utc) + timedelta(hours=24)},
-            os.environ.get('JWT_SECRET', 'your-secret-key'),
+            JWT_SECRET,
             algorithm="HS256"
         )
         
         user = user_repo.get_by_id(user_id)
         if not user:
             raise HTTPException(status_code=404, detail=ERROR_MESSAGES['USER_NOT_FOUND'])
-        return SessionResponse(sessionToken=session_token, user=User(**user))
+        return SessionResponse(sessionToken=session_token, user=User.from_trusted(user))
         
     except HTTPException:
         raise
@@ -182,18 +192,20 @@ async def create_session(session_data: SessionCreate):
         logger.error(f"Session creation error: {e}", exc_info=True)
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
-@router.get("/user", response_model=User)
+@router.get("/user", response_model=User, dependencies=[Depends(rate_limit_dep)])
 async def get_current_user(token_data: dict = Depends(verify_token)):
+    user_repo = get_user_repo()
     if not user_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user = user_repo.get_by_id(token_data['uid'])
     if not user:
         raise HTTPException(status_code=404, detail=ERROR_MESSAGES['USER_NOT_FOUND'])
-    return User(**user)
+    return User.from_trusted(user)
 
-@router.post("/set-password")
+@router.post("/set-password", dependencies=[Depends(rate_limit_dep)])
 async def set_master_password(password_data: PasswordAuth, token_data: dict = Depends(verify_token)):
     """Set or update master password (passkey)"""
+    user_repo = get_user_repo()
     user_id = token_data['uid']
     
     if not user_repo:
@@ -218,9 +230,10 @@ async def set_master_password(password_data: PasswordAuth, token_data: dict = De
         logger.error(f"Error setting password for user {user_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to set passkey: {str(e)}")
 
-@router.post("/verify-password")
+@router.post("/verify-password", dependencies=[Depends(rate_limit_dep)])
 async def verify_master_password(password_data: PasswordAuth, token_data: dict = Depends(verify_token)):
     """Verify master password (passkey)"""
+    user_repo = get_user_repo()
     user_id = token_data['uid']
     
     if not user_repo:
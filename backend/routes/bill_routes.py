@@ -2,15 +2,16 @@
 Bill management routes
 """
 import logging
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
 from backend.models import Bill, BillCreate, SettlementRequest
 from backend.middleware.auth import verify_token
+from backend.middleware.rate_limit import rate_limit_dep
 from backend.controllers.bill_controller import BillController
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/spaces", tags=["bills"])
+router = APIRouter(prefix="/api/spaces", tags=["bills"], dependencies=[Depends(rate_limit_dep)])
 
 @router.post("/{space_id}/bills", response_model=Bill)
 async def create_bill(space_id: str, bill_data: BillCreate, token_data: dict = Depends(verify_token)):
@@ -33,10 +34,10 @@ async def get_balances(space_id: str, token_data: dict = Depends(verify_token)):
     return BillController.get_balances(space_id, user_id)
 
 @router.get("/{space_id}/bills/history")
-async def get_settlement_history(space_id: str, token_data: dict = Depends(verify_token)):
-    """Get settlement history for a space"""
+async def get_settlement_history(space_id: str, pageSize: int = Query(50, ge=1, le=500), cursor: Optional[str] = None, token_data: dict = Depends(verify_token)):
+    """Get settlement history for a space, one page at a time"""
     user_id = token_data['uid']
-    return BillController.get_settlement_history(space_id, user_id)
+    return BillController.get_settlement_history(space_id, user_id, pageSize, cursor)
 
 @router.get("/{space_id}/bills/{bill_id}", response_model=Bill)
 async def get_bill(space_id: str, bill_id: str, token_data: dict = Depends(verify_token)):
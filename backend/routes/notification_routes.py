@@ -8,26 +8,25 @@ from typing import List
 from fastapi import APIRouter, HTTPException, Depends
 from backend.models import Notification, NotificationCreate
 from backend.middleware.auth import verify_token
-from backend.config import db
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import get_notification_repo
 from backend.constants import ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/notifications", tags=["notifications"])
-
-# Initialize repository (imported from config to avoid circular imports)
-from backend.config import notification_repo
+router = APIRouter(prefix="/api/notifications", tags=["notifications"], dependencies=[Depends(rate_limit_dep)])
 
 @router.get("", response_model=List[Notification])
 async def get_notifications(token_data: dict = Depends(verify_token)):
     """Get all notifications for the current user"""
+    notification_repo = get_notification_repo()
     if not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
     user_id = token_data['uid']
     try:
         notifications = notification_repo.get_by_user_id(user_id)
-        return [Notification(**notif) for notif in notifications]
+        return [Notification.from_trusted(notif) for notif in notifications]
     except Exception as e:
         logger.error(f"Error fetching notifications: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to fetch notifications: {str(e)}")
@@ -35,6 +34,7 @@ async def get_notifications(token_data: dict = Depends(verify_token)):
 @router.put("/{notification_id}/read")
 async def mark_notification_read(notification_id: str, token_data: dict = Depends(verify_token)):
     """Mark a notification as read"""
+    notification_repo = get_notification_repo()
     if not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -49,7 +49,7 @@ async def mark_notification_read(notification_id: str, token_data: dict = Depend
         raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
     
     try:
-        notification_repo.update(notification_id, {'read': True})
+        notification_repo.update(notification_id, {'read': True}, user_id=user_id)
         return {"message": "Notification marked as read"}
     except Exception as e:
         logger.error(f"Error marking notification as read: {e}", exc_info=True)
@@ -58,6 +58,7 @@ async def mark_notification_read(notification_id: str, token_data: dict = Depend
 @router.delete("/{notification_id}")
 async def delete_notification(notification_id: str, token_data: dict = Depends(verify_token)):
     """Delete a notification"""
+    notification_repo = get_notification_repo()
     if not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -72,7 +73,7 @@ async def delete_notification(notification_id: str, token_data: dict = Depends(v
         raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
     
     try:
-        notification_repo.delete(notification_id)
+        notification_repo.delete(notification_id, user_id=user_id)
         return {"message": "Notification deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting notification: {e}", exc_info=True)
@@ -81,6 +82,7 @@ async def delete_notification(notification_id: str, token_data: dict = Depends(v
 @router.delete("")
 async def clear_all_notifications(token_data: dict = Depends(verify_token)):
     """Delete all notifications for the current user"""
+    notification_repo = get_notification_repo()
     if not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -89,13 +91,10 @@ async def clear_all_notifications(token_data: dict = Depends(verify_token)):
     try:
         # Get all notifications for the user
         notifications = notification_repo.get_by_user_id(user_id, limit=1000)
-        deleted_count = 0
-        for notification in notifications:
-            try:
-                notification_repo.delete(notification.get('notificationId'))
-                deleted_count += 1
-            except Exception as e:
-                logger.warning(f"Failed to delete notification {notification.get('notificationId')}: {e}")
+        deleted_count = notification_repo.delete_many(
+            [n['notificationId'] for n in notifications],
+            user_id
+        )
         
         return {"message": f"Cleared {deleted_count} notifications", "deletedCount": deleted_count}
     except Exception as e:
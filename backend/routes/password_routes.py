@@ -6,20 +6,20 @@ import logging
 from datetime import datetime, timezone
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from backend.models import Password, PasswordCreate
 from backend.middleware.auth import verify_token
-from backend.config import db, user_repo
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import get_user_repo, get_password_repo
 from backend.constants import ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/passwords", tags=["passwords"])
-
-# Initialize repository (imported from config to avoid circular imports)
-from backend.config import password_repo
+router = APIRouter(prefix="/api/passwords", tags=["passwords"], dependencies=[Depends(rate_limit_dep)])
 
 @router.post("", response_model=Password)
 async def create_password_endpoint(password_data: PasswordCreate, token_data: dict = Depends(verify_token)):
+    password_repo = get_password_repo()
     if not password_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
@@ -37,7 +37,7 @@ async def create_password_endpoint(password_data: PasswordCreate, token_data: di
     
     try:
         created = password_repo.create(doc)
-        return Password(**created)
+        return Password.from_trusted(created)
     except Exception as e:
         logger.error(f"Error creating password: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to create password: {str(e)}")
@@ -45,6 +45,8 @@ async def create_password_endpoint(password_data: PasswordCreate, token_data: di
 @router.get("/export")
 async def export_passwords(token_data: dict = Depends(verify_token)):
     """Export all passwords for the user. Requires passkey to be enabled."""
+    user_repo = get_user_repo()
+    password_repo = get_password_repo()
     if not password_repo or not user_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -70,7 +72,7 @@ async def export_passwords(token_data: dict = Depends(verify_token)):
     try:
         # Get all passwords for the user (including shared)
         logger.info(f"Fetching passwords for user {user_id}")
-        passwords = password_repo.get_by_user_id(user_id, space_id=None, include_shared=True)
+        passwords = await run_in_threadpool(password_repo.get_by_user_id, user_id, space_id=None, include_shared=True)
         logger.info(f"Found {len(passwords)} passwords for export")
         
         # Format passwords for export (include all metadata)
@@ -113,18 +115,21 @@ async def export_passwords(token_data: dict = Depends(verify_token)):
 
 @router.get("", response_model=List[Password])
 async def get_passwords(spaceId: Optional[str] = None, includeShared: Optional[bool] = True, token_data: dict = Depends(verify_token)):
+    password_repo = get_password_repo()
     if not password_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
     try:
-        passwords = password_repo.get_by_user_id(user_id, space_id=spaceId, include_shared=includeShared)
-        return [Password(**pwd) for pwd in passwords]
+        # Multi-query fan-out; run it off the event loop so other requests keep being served
+        passwords = await run_in_threadpool(password_repo.get_by_user_id, user_id, space_id=spaceId, include_shared=includeShared)
+        return [Password.from_trusted(pwd) for pwd in passwords]
     except Exception as e:
         logger.error(f"Error fetching passwords: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to fetch passwords: {str(e)}")
 
 @router.put("/{password_id}", response_model=Password)
 async def update_password_endpoint(password_id: str, password_data: PasswordCreate, token_data: dict = Depends(verify_token)):
+    password_repo = get_password_repo()
     if not password_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
@@ -143,15 +148,16 @@ async def update_password_endpoint(password_id: str, password_data: PasswordCrea
     }
     
     try:
-        password_repo.update(password_id, update_doc)
+        password_repo.update(password_id, update_doc, user_id=user_id)
         updated = password_repo.get_by_id(password_id)
-        return Password(**updated)
+        return Password.from_trusted(updated)
     except Exception as e:
         logger.error(f"Error updating password: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to update password: {str(e)}")
 
 @router.delete("/{password_id}")
 async def delete_password_endpoint(password_id: str, token_data: dict = Depends(verify_token)):
+    password_repo = get_password_repo()
     if not password_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
@@ -165,7 +171,7 @@ async def delete_password_endpoint(password_id: str, token_data: dict = Depends(
         raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
     
     try:
-        password_repo.delete(password_id)
+        password_repo.delete(password_id, user_id=user_id)
         return {"message": "Password deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting password: {e}", exc_info=True)
@@ -5,15 +5,17 @@ import logging
 from fastapi import APIRouter, HTTPException, Depends
 from backend.models import SearchQuery
 from backend.middleware.auth import verify_token
-from backend.config import db
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import get_db
 from backend.constants import QUERY_LIMITS
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/search", tags=["search"])
+router = APIRouter(prefix="/api/search", tags=["search"], dependencies=[Depends(rate_limit_dep)])
 
 @router.post("")
 async def search(search_query: SearchQuery, token_data: dict = Depends(verify_token)):
+    db = get_db()
     user_id = token_data['uid']
     query_text = search_query.query.lower()
     
@@ -6,20 +6,20 @@ import logging
 from datetime import datetime, timezone
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from backend.models import Space, SpaceCreate
 from backend.middleware.auth import verify_token
-from backend.config import db
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import get_space_repo, get_user_repo, get_notification_repo
 from backend.constants import ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/spaces", tags=["spaces"])
-
-# Initialize repositories (imported from config to avoid circular imports)
-from backend.config import space_repo, user_repo, notification_repo
+router = APIRouter(prefix="/api/spaces", tags=["spaces"], dependencies=[Depends(rate_limit_dep)])
 
 @router.post("", response_model=Space)
 async def create_space_endpoint(space_data: SpaceCreate, token_data: dict = Depends(verify_token)):
+    space_repo = get_space_repo()
     if not space_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
@@ -38,19 +38,21 @@ async def create_space_endpoint(space_data: SpaceCreate, token_data: dict = Depe
     
     try:
         created = space_repo.create(doc)
-        return Space(**created)
+        return Space.from_trusted(created)
     except Exception as e:
         logger.error(f"Error creating space: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to create space: {str(e)}")
 
 @router.get("", response_model=List[Space])
 async def get_spaces_endpoint(token_data: dict = Depends(verify_token)):
+    space_repo = get_space_repo()
     if not space_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
     try:
-        spaces = space_repo.get_all_for_user(user_id)
-        return [Space(**s) for s in spaces]
+        # Multi-query fan-out; run it off the event loop so other requests keep being served
+        spaces = await run_in_threadpool(space_repo.get_all_for_user, user_id)
+        return [Space.from_trusted(s) for s in spaces]
     except Exception as e:
         logger.error(f"Error fetching spaces: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to fetch spaces: {str(e)}")
@@ -58,6 +60,9 @@ async def get_spaces_endpoint(token_data: dict = Depends(verify_token)):
 @router.post("/{space_id}/members")
 async def add_space_member(space_id: str, member_data: dict, token_data: dict = Depends(verify_token)):
     """Add a member to a space"""
+    user_repo = get_user_repo()
+    space_repo = get_space_repo()
+    notification_repo = get_notification_repo()
     if not space_repo or not user_repo or not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -87,7 +92,7 @@ async def add_space_member(space_id: str, member_data: dict, token_data: dict =
     
     # Add member
     try:
-        updated_space = space_repo.add_member(space_id, member_user_id)
+        updated_space = space_repo.add_member(space_id, member_user_id, existing=space)
         
         # Get owner info for notification
         owner = user_repo.get_by_id(space.get('ownerId'))
@@ -108,7 +113,7 @@ async def add_space_member(space_id: str, member_data: dict, token_data: dict =
         }
         notification_repo.create(notification_doc)
         
-        return Space(**updated_space)
+        return Space.from_trusted(updated_space)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -118,6 +123,8 @@ async def add_space_member(space_id: str, member_data: dict, token_data: dict =
 @router.delete("/{space_id}/members/{member_id}")
 async def remove_space_member(space_id: str, member_id: str, token_data: dict = Depends(verify_token)):
     """Remove a member from a space"""
+    space_repo = get_space_repo()
+    notification_repo = get_notification_repo()
     if not space_repo or not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -136,7 +143,7 @@ async def remove_space_member(space_id: str, member_id: str, token_data: dict =
     
     # Remove member
     try:
-        updated_space = space_repo.remove_member(space_id, member_id)
+        updated_space = space_repo.remove_member(space_id, member_id, existing=space)
         
         # Create notification for the removed member
         notification_id = f"notif_{uuid.uuid4()}"
@@ -153,7 +160,7 @@ async def remove_space_member(space_id: str, member_id: str, token_data: dict =
         }
         notification_repo.create(notification_doc)
         
-        return Space(**updated_space)
+        return Space.from_trusted(updated_space)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -163,6 +170,8 @@ async def remove_space_member(space_id: str, member_id: str, token_data: dict =
 @router.post("/{space_id}/transfer-ownership")
 async def transfer_ownership(space_id: str, transfer_data: dict, token_data: dict = Depends(verify_token)):
     """Transfer space ownership to another user"""
+    space_repo = get_space_repo()
+    notification_repo = get_notification_repo()
     if not space_repo or not notification_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -200,7 +209,7 @@ async def transfer_ownership(space_id: str, transfer_data: dict, token_data: dic
         }
         notification_repo.create(notification_doc)
         
-        return Space(**updated_space)
+        return Space.from_trusted(updated_space)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -210,6 +219,7 @@ async def transfer_ownership(space_id: str, transfer_data: dict, token_data: dic
 @router.post("/{space_id}/admins")
 async def add_space_admin(space_id: str, admin_data: dict, token_data: dict = Depends(verify_token)):
     """Add an admin to a space"""
+    space_repo = get_space_repo()
     if not space_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -230,8 +240,8 @@ async def add_space_admin(space_id: str, admin_data: dict, token_data: dict = De
     
     # Add admin
     try:
-        updated_space = space_repo.add_admin(space_id, admin_user_id)
-        return Space(**updated_space)
+        updated_space = space_repo.add_admin(space_id, admin_user_id, existing=space)
+        return Space.from_trusted(updated_space)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -241,6 +251,7 @@ async def add_space_admin(space_id: str, admin_data: dict, token_data: dict = De
 @router.delete("/{space_id}/admins/{admin_id}")
 async def remove_space_admin(space_id: str, admin_id: str, token_data: dict = Depends(verify_token)):
     """Remove an admin from a space"""
+    space_repo = get_space_repo()
     if not space_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -257,8 +268,8 @@ async def remove_space_admin(space_id: str, admin_id: str, token_data: dict = De
     
     # Remove admin
     try:
-        updated_space = space_repo.remove_admin(space_id, admin_id)
-        return Space(**updated_space)
+        updated_space = space_repo.remove_admin(space_id, admin_id, existing=space)
+        return Space.from_trusted(updated_space)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
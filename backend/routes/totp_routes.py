@@ -6,20 +6,20 @@ import logging
 from datetime import datetime, timezone
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from backend.models import TOTP, TOTPCreate
 from backend.middleware.auth import verify_token
-from backend.config import db
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import get_totp_repo
 from backend.constants import ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/totp", tags=["totp"])
-
-# Initialize repository (imported from config to avoid circular imports)
-from backend.config import totp_repo
+router = APIRouter(prefix="/api/totp", tags=["totp"], dependencies=[Depends(rate_limit_dep)])
 
 @router.post("", response_model=TOTP)
 async def create_totp_endpoint(totp_data: TOTPCreate, token_data: dict = Depends(verify_token)):
+    totp_repo = get_totp_repo()
     if not totp_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     try:
@@ -35,7 +35,7 @@ async def create_totp_endpoint(totp_data: TOTPCreate, token_data: dict = Depends
         }
     
         created = totp_repo.create(doc)
-        return TOTP(**created)
+        return TOTP.from_trusted(created)
     except HTTPException:
         raise
     except Exception as e:
@@ -44,18 +44,21 @@ async def create_totp_endpoint(totp_data: TOTPCreate, token_data: dict = Depends
 
 @router.get("", response_model=List[TOTP])
 async def get_totp_list(spaceId: Optional[str] = None, includeShared: Optional[bool] = True, token_data: dict = Depends(verify_token)):
+    totp_repo = get_totp_repo()
     if not totp_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
     try:
-        totps = totp_repo.get_by_user_id(user_id, space_id=spaceId, include_shared=includeShared)
-        return [TOTP(**t) for t in totps]
+        # Multi-query fan-out; run it off the event loop so other requests keep being served
+        totps = await run_in_threadpool(totp_repo.get_by_user_id, user_id, space_id=spaceId, include_shared=includeShared)
+        return [TOTP.from_trusted(t) for t in totps]
     except Exception as e:
         logger.error(f"Error fetching TOTPs: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to fetch TOTPs: {str(e)}")
 
 @router.delete("/{totp_id}")
 async def delete_totp_endpoint(totp_id: str, token_data: dict = Depends(verify_token)):
+    totp_repo = get_totp_repo()
     if not totp_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     user_id = token_data['uid']
@@ -69,7 +72,7 @@ async def delete_totp_endpoint(totp_id: str, token_data: dict = Depends(verify_t
         raise HTTPException(status_code=403, detail=ERROR_MESSAGES['NOT_AUTHORIZED'])
     
     try:
-        totp_repo.delete(totp_id)
+        totp_repo.delete(totp_id, user_id=user_id)
         return {"message": "TOTP deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting TOTP: {e}", exc_info=True)
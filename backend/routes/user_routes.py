@@ -4,15 +4,13 @@ User management routes
 import logging
 from fastapi import APIRouter, HTTPException, Depends
 from backend.middleware.auth import verify_token
-from backend.config import db
+from backend.middleware.rate_limit import rate_limit_dep
+from backend.config import get_user_repo
 from backend.constants import ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/users", tags=["users"])
-
-# Initialize repository (imported from config to avoid circular imports)
-from backend.config import user_repo
+router = APIRouter(prefix="/api/users", tags=["users"], dependencies=[Depends(rate_limit_dep)])
 
 # Note: /search route must come before /{user_id} to avoid route conflicts
 @router.get("/search")
@@ -25,6 +23,7 @@ async def search_users(query: str = "", token_data: dict = Depends(verify_token)
     
     Returns users matching the query by email or display name.
     """
+    user_repo = get_user_repo()
     if not user_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -54,6 +53,7 @@ async def search_users(query: str = "", token_data: dict = Depends(verify_token)
 @router.get("/{user_id}")
 async def get_user(user_id: str, token_data: dict = Depends(verify_token)):
     """Get user details by user ID"""
+    user_repo = get_user_repo()
     if not user_repo:
         raise HTTPException(status_code=503, detail=ERROR_MESSAGES['DATABASE_UNAVAILABLE'])
     
@@ -93,6 +93,7 @@ async def get_user(user_id: str, token_data: dict = Depends(verify_token)):
 @router.patch("/me/settings")
 async def update_settings(settings: dict, token_data: dict = Depends(verify_token)):
     """Update user preferences/settings"""
+    user_repo = get_user_repo()
     user_id = token_data['uid']
     
     if not user_repo:
@@ -131,6 +132,7 @@ async def update_settings(settings: dict, token_data: dict = Depends(verify_toke
 @router.delete("/me")
 async def delete_account(token_data: dict = Depends(verify_token)):
     """Soft delete user account - mark as inactive instead of deleting"""
+    user_repo = get_user_repo()
     user_id = token_data['uid']
     
     if not user_repo:
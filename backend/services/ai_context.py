@@ -125,7 +125,11 @@ class AIContextService:
                     "total_owing": round(total_owing, 2)
                 }
             
-            logger.debug(f"Gathered context for user {user_id}: {len(context['spaces'])} spaces, {len(context['passwords'])} passwords, {len(context['totps'])} TOTPs")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Gathered context for user %s: %d spaces, %d passwords, %d TOTPs",
+                    user_id, len(context['spaces']), len(context['passwords']), len(context['totps'])
+                )
             
         except Exception as e:
             logger.error(f"Error gathering context for user {user_id}: {e}", exc_info=True)
@@ -3,7 +3,8 @@ Cache Service - In-memory caching with TTL support
 """
 import time
 import logging
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, Iterable, Set
+from collections import defaultdict
 from threading import Lock
 
 logger = logging.getLogger(__name__)
@@ -11,8 +12,24 @@ logger = logging.getLogger(__name__)
 class CacheService:
     def __init__(self):
         self._cache: Dict[str, Dict[str, Any]] = {}
+        # group name -> keys set under it, so a group is invalidated without scanning the cache
+        self._groups: Dict[str, Set[str]] = defaultdict(set)
         self._lock = Lock()
     
+    def _remove(self, key: str) -> bool:
+        """Drop a key and its group membership; caller must hold the lock"""
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return False
+        group = entry.get('group')
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+        return True
+    
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache if not expired"""
         with self._lock:
@@ -21,24 +38,27 @@ class CacheService:
             
             entry = self._cache[key]
             if time.time() > entry['expires_at']:
-                del self._cache[key]
+                self._remove(key)
                 return None
             
             return entry['value']
     
-    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
-        """Set value in cache with TTL"""
+    def set(self, key: str, value: Any, ttl_seconds: int, group: Optional[str] = None) -> None:
+        """Set value in cache with TTL, optionally tracked under a group for invalidate_group()"""
         with self._lock:
+            self._remove(key)
             self._cache[key] = {
                 'value': value,
-                'expires_at': time.time() + ttl_seconds
+                'expires_at': time.time() + ttl_seconds,
+                'group': group
             }
+            if group is not None:
+                self._groups[group].add(key)
     
     def delete(self, key: str) -> None:
         """Delete key from cache"""
         with self._lock:
-            if key in self._cache:
-                del self._cache[key]
+            self._remove(key)
     
     def invalidate_pattern(self, pattern: str) -> int:
         """Invalidate all keys matching pattern (prefix match)"""
@@ -46,14 +66,39 @@ class CacheService:
         with self._lock:
             keys_to_delete = [k for k in self._cache.keys() if k.startswith(pattern)]
             for key in keys_to_delete:
-                del self._cache[key]
+                self._remove(key)
                 count += 1
         return count
     
+    def invalidate_group(self, group: str) -> int:
+        """Invalidate every key set under group; cost scales with the group, not the cache"""
+        count = 0
+        with self._lock:
+            for key in self._groups.pop(group, ()):
+                if self._cache.pop(key, None) is not None:
+                    count += 1
+        return count
+    
+    def invalidate_many(self, patterns: Iterable[str] = (), keys: Iterable[str] = ()) -> int:
+        """Invalidate exact keys and prefix patterns in one locked pass over the cache"""
+        prefixes = tuple(patterns)
+        count = 0
+        with self._lock:
+            for key in keys:
+                if self._remove(key):
+                    count += 1
+            if prefixes:
+                keys_to_delete = [k for k in self._cache if k.startswith(prefixes)]
+                for key in keys_to_delete:
+                    self._remove(key)
+                count += len(keys_to_delete)
+        return count
+    
     def clear(self) -> None:
         """Clear all cache"""
         with self._lock:
             self._cache.clear()
+            self._groups.clear()
     
     def cleanup_expired(self) -> int:
         """Remove expired entries, returns count of removed entries"""
@@ -65,7 +110,7 @@ class CacheService:
                 if now > v['expires_at']
             ]
             for key in keys_to_delete:
-                del self._cache[key]
+                self._remove(key)
                 count += 1
         return count
 
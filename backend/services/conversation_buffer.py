@@ -24,6 +24,7 @@ class ConversationBuffer:
         if self.session_id not in _sessions:
             _sessions[self.session_id] = {
                 "messages": [],
+                "last_assistant": None,
                 "created_at": datetime.utcnow().isoformat(),
                 "last_activity": datetime.utcnow().isoformat()
             }
@@ -33,6 +34,7 @@ class ConversationBuffer:
         if self.session_id not in _sessions:
             _sessions[self.session_id] = {
                 "messages": [],
+                "last_assistant": None,
                 "created_at": datetime.utcnow().isoformat(),
                 "last_activity": datetime.utcnow().isoformat()
             }
@@ -47,12 +49,15 @@ class ConversationBuffer:
         session = _sessions[self.session_id]
         session["messages"].append(message)
         session["last_activity"] = datetime.utcnow().isoformat()
+        if role == "assistant":
+            session["last_assistant"] = content
         
         # Trim to max messages
         if len(session["messages"]) > self.MAX_MESSAGES:
             session["messages"] = session["messages"][-self.MAX_MESSAGES:]
         
-        logger.debug(f"Added message to session {self.session_id}: {role} - {content[:50]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Added message to session %s: %s - %s...", self.session_id, role, content[:50])
     
     def get_messages(self, include_system: bool = True) -> List[Dict]:
         """Get conversation messages for LLM"""
@@ -71,6 +76,11 @@ class ConversationBuffer:
         
         return messages
     
+    def last_assistant_message(self) -> Optional[str]:
+        """Content of the most recent assistant message, tracked on write instead of scanning history"""
+        session = _sessions.get(self.session_id)
+        return session.get("last_assistant") if session else None
+    
     def get_recent_messages(self, count: int = 10) -> List[Dict]:
         """Get recent messages"""
         messages = self.get_messages(include_system=False)
@@ -80,6 +90,7 @@ class ConversationBuffer:
         """Clear conversation history"""
         if self.session_id in _sessions:
             _sessions[self.session_id]["messages"] = []
+            _sessions[self.session_id]["last_assistant"] = None
     
     def is_first_message(self) -> bool:
         """Check if this is the first user message in session"""
@@ -120,5 +131,5 @@ def cleanup_old_sessions():
     
     for session_id in sessions_to_remove:
         del _sessions[session_id]
-        logger.debug(f"Cleaned up old session: {session_id}")
+        logger.debug("Cleaned up old session: %s", session_id)
 
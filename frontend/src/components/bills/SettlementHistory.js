@@ -1,9 +1,10 @@
 import React, { useMemo } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '../ui/card';
+import { Button } from '../ui/button';
 import { History, CheckCircle2 } from 'lucide-react';
 import { formatCurrency } from '../../utils/currency';
 
-export default function SettlementHistory({ history = [], bills = {}, users = {}, onBillClick = null, currentUserId = null }) {
+export default function SettlementHistory({ history = [], bills = {}, users = {}, onBillClick = null, currentUserId = null, hasMore = false, onLoadMore = null, loadingMore = false }) {
   // Filter to only show settlements for settled bills
   const settledHistory = useMemo(() => {
     if (!history || !bills) return [];
@@ -13,6 +14,15 @@ export default function SettlementHistory({ history = [], bills = {}, users = {}
     });
   }, [history, bills]);
 
+  // History is paged by the API; older settlements are fetched on demand
+  const loadMoreButton = hasMore && onLoadMore ? (
+    <div className="flex justify-center pt-3">
+      <Button variant="outline" size="sm" onClick={onLoadMore} disabled={loadingMore}>
+        {loadingMore ? 'Loading...' : 'Load more'}
+      </Button>
+    </div>
+  ) : null;
+
   if (!settledHistory || settledHistory.length === 0) {
     return (
       <Card>
@@ -26,6 +36,7 @@ export default function SettlementHistory({ history = [], bills = {}, users = {}
           <p className="text-sm text-muted-foreground text-center py-4">
             No settled bills yet
           </p>
+          {loadMoreButton}
         </CardContent>
       </Card>
     );
@@ -117,6 +128,7 @@ export default function SettlementHistory({ history = [], bills = {}, users = {}
             );
           })}
         </div>
+        {loadMoreButton}
       </CardContent>
     </Card>
   );
@@ -40,12 +40,15 @@ export default function SpaceDetail() {
     bills,
     balances,
     history,
+    historyCursor,
+    loadingMoreHistory,
     loadBills,
     createBill,
     updateBill,
     deleteBill,
     loadBalances,
     loadHistory,
+    loadMoreHistory,
     clear
   } = useBillStore();
 
@@ -171,6 +174,18 @@ export default function SpaceDetail() {
     // Note: loadBills, loadBalances, loadHistory are from Zustand store and should be stable
   }, [spaceId, currentUser, getAuthHeaders]);
 
+  const handleLoadMoreHistory = useCallback(async () => {
+    if (!spaceId) return;
+    try {
+      const headers = await getAuthHeaders();
+      if (!headers || !headers.Authorization) return;
+      await loadMoreHistory(spaceId, headers);
+    } catch (error) {
+      console.error('Failed to load more history:', error);
+    }
+    // Note: loadMoreHistory is from Zustand store and should be stable
+  }, [spaceId, getAuthHeaders]);
+
   useEffect(() => {
     // Wait for auth to be ready before loading space
     if (!authLoading && currentUser) {
@@ -494,6 +509,9 @@ export default function SpaceDetail() {
                 users={users}
                 onBillClick={handleViewBillDetails}
                 currentUserId={currentUser?.userId}
+                hasMore={!!historyCursor}
+                onLoadMore={handleLoadMoreHistory}
+                loadingMore={loadingMoreHistory}
               />
             </div>
           </div>
@@ -84,12 +84,15 @@ export const billService = {
     return response.data || { balances: [] };
   },
 
-  // Get settlement history
-  async getHistory(spaceId, headers = null) {
+  // Get one page of settlement history; pass the previous page's nextCursor to get the next one
+  async getHistory(spaceId, headers = null, { cursor = null, pageSize = null } = {}) {
     const authHeaders = headers || await getAuthHeaders();
+    const params = {};
+    if (cursor) params.cursor = cursor;
+    if (pageSize) params.pageSize = pageSize;
     const response = await apiClient.get(
       getApiUrl(`/api/spaces/${spaceId}/bills/history`),
-      { headers: authHeaders }
+      { headers: authHeaders, params }
     );
     return response.data;
   },
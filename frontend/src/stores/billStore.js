@@ -8,6 +8,8 @@ const useBillStore = create((set, get) => ({
   bills: [],
   balances: [],
   history: [],
+  historyCursor: null,
+  loadingMoreHistory: false,
   loading: false,
   error: null,
   cache: {
@@ -160,7 +162,7 @@ const useBillStore = create((set, get) => ({
     }
   },
 
-  // Load settlement history with caching
+  // Load the first page of settlement history with caching
   loadHistory: async (spaceId, headers = null, forceRefresh = false) => {
     const { cache } = get();
     const cacheKey = `history_${spaceId}`;
@@ -170,7 +172,7 @@ const useBillStore = create((set, get) => ({
     if (!forceRefresh && cached && cached.timestamp) {
       const age = Date.now() - cached.timestamp;
       if (age < CACHE_TTL) {
-        set({ history: cached.data, loading: false });
+        set({ history: cached.data, historyCursor: cached.nextCursor || null, loading: false });
         return cached.data;
       }
     }
@@ -179,15 +181,17 @@ const useBillStore = create((set, get) => ({
     try {
       const data = await billService.getHistory(spaceId, headers);
       const history = data.history || [];
+      const nextCursor = data.nextCursor || null;
       // Update cache
       set({
         history,
+        historyCursor: nextCursor,
         loading: false,
         cache: {
           ...cache,
           history: {
             ...cache.history,
-            [cacheKey]: { data: history, timestamp: Date.now() }
+            [cacheKey]: { data: history, nextCursor, timestamp: Date.now() }
           }
         }
       });
@@ -199,12 +203,46 @@ const useBillStore = create((set, get) => ({
     }
   },
 
+  // Append the next page of settlement history (no-op when every page is loaded)
+  loadMoreHistory: async (spaceId, headers = null) => {
+    const { historyCursor, loadingMoreHistory } = get();
+    if (!historyCursor || loadingMoreHistory) return get().history;
+
+    set({ loadingMoreHistory: true, error: null });
+    try {
+      const data = await billService.getHistory(spaceId, headers, { cursor: historyCursor });
+      const nextCursor = data.nextCursor || null;
+      const cacheKey = `history_${spaceId}`;
+      const { history, cache } = get();
+      const merged = [...history, ...(data.history || [])];
+      set({
+        history: merged,
+        historyCursor: nextCursor,
+        loadingMoreHistory: false,
+        cache: {
+          ...cache,
+          history: {
+            ...cache.history,
+            [cacheKey]: { data: merged, nextCursor, timestamp: Date.now() }
+          }
+        }
+      });
+      return merged;
+    } catch (error) {
+      console.error('Failed to load more history:', error);
+      set({ error: error.message, loadingMoreHistory: false });
+      return get().history;
+    }
+  },
+
   // Clear store
   clear: () => {
     set({
       bills: [],
       balances: [],
       history: [],
+      historyCursor: null,
+      loadingMoreHistory: false,
       loading: false,
       error: null
     });